@@ -0,0 +1,120 @@
+"""
+app_logging.py
+
+Structured, level-gated logging for the app. Logging is configured once per process under the
+'column_mapping' logger (never the root logger), every record carries a per-session correlation ID,
+and large debug payloads are built lazily and only for a sampled fraction of calls.
+
+Environment variables:
+    COLUMN_MAPPING_LOG_LEVEL: Log level (default INFO).
+    COLUMN_MAPPING_LOG_FORMAT: 'text' (default) or 'json'.
+    COLUMN_MAPPING_DEBUG_SAMPLE_RATE: Fraction of debug payloads to emit (default 0.1).
+"""
+
+import json
+import logging
+import os
+import random
+import uuid
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+LOGGER_NAME = "column_mapping"
+SESSION_ID_KEY = "_session_id"
+
+_debug_sample_rate = 0.1
+
+class SessionFilter(logging.Filter):
+    """
+    Adds the Streamlit session correlation ID to every record as `session_id`.
+    """
+    def filter(self, record):
+        record.session_id = get_session_id()
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats records as one JSON object per line, including any `extra` fields.
+    """
+    RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "session_id": getattr(record, "session_id", "-"),
+            "message": record.getMessage(),
+        }
+        entry.update({k: v for k, v in vars(record).items() if k not in self.RESERVED and k not in entry})
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+def get_session_id():
+    """
+    Returns a short correlation ID for the current Streamlit session, or '-' outside a session.
+    """
+    if get_script_run_ctx(suppress_warning=True) is None:
+        return "-"
+    try:
+        if SESSION_ID_KEY not in st.session_state:
+            st.session_state[SESSION_ID_KEY] = uuid.uuid4().hex[:8]
+        return st.session_state[SESSION_ID_KEY]
+    except Exception:
+        return "-"
+
+def configure_logging(level=None, fmt=None, debug_sample_rate=None):
+    """
+    Configures the app logger once per process; later calls are no-ops.
+    Args:
+        level (str): Log level name. Defaults to COLUMN_MAPPING_LOG_LEVEL or INFO.
+        fmt (str): 'text' or 'json'. Defaults to COLUMN_MAPPING_LOG_FORMAT or text.
+        debug_sample_rate (float): Fraction of debug payloads to emit. Defaults to COLUMN_MAPPING_DEBUG_SAMPLE_RATE or 0.1.
+    Returns:
+        logging.Logger: The app logger.
+    """
+    global _debug_sample_rate
+    logger = logging.getLogger(LOGGER_NAME)
+    if logger.handlers:
+        return logger
+    level = level or os.environ.get("COLUMN_MAPPING_LOG_LEVEL", "INFO")
+    fmt = fmt or os.environ.get("COLUMN_MAPPING_LOG_FORMAT", "text")
+    if debug_sample_rate is None:
+        debug_sample_rate = float(os.environ.get("COLUMN_MAPPING_DEBUG_SAMPLE_RATE", "0.1"))
+    _debug_sample_rate = debug_sample_rate
+    handler = logging.StreamHandler()
+    handler.addFilter(SessionFilter())
+    if fmt == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(name)s - [%(session_id)s] %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(level.upper())
+    # Keep app records out of the root logger (and Streamlit's handlers)
+    logger.propagate = False
+    return logger
+
+def get_logger(name):
+    """
+    Returns a child of the app logger, e.g. get_logger("mapping_logic") -> 'column_mapping.mapping_logic'.
+    """
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
+
+def log_debug_payload(logger, message, payload_fn, sample_rate=None):
+    """
+    Logs a large debug payload lazily: payload_fn is only called if DEBUG is enabled and the call is sampled.
+    Args:
+        logger (logging.Logger): Logger to use.
+        message (str): Log message; the payload is attached as the `payload` extra field.
+        payload_fn (callable): Zero-argument function building the payload.
+        sample_rate (float): Overrides the configured debug sample rate.
+    """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    rate = _debug_sample_rate if sample_rate is None else sample_rate
+    if rate < 1 and random.random() >= rate:
+        return
+    payload = payload_fn()
+    logger.debug("%s: %s", message, payload, extra={"payload": payload})
@@ -0,0 +1,357 @@
+"""
+benchmark.py
+
+Reproducible throughput benchmark for the mapping pipeline.
+Generates synthetic CSV/XLSX inputs (duplicate headers, date columns, multiple sheets), an output template
+and a mapping file, runs the same steps as the app headlessly and records seconds, rows/sec, peak RSS and
+output sizes per stage. Results can be saved as a baseline and compared on later runs.
+
+Usage:
+    python benchmarks/benchmark.py                       # run the default scenarios
+    python benchmarks/benchmark.py --scenario wide_csv   # run one scenario
+    python benchmarks/benchmark.py --save-baseline       # store results in benchmarks/baseline.json
+    python benchmarks/benchmark.py --compare             # compare against the stored baseline
+    python benchmarks/benchmark.py --readers --reader-size-mb 1000   # compare CSV reader backends on a ~1 GB file
+    python benchmarks/benchmark.py --startup                         # app cold-start and warm-rerun times
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_utils import CSV_READERS, HAS_PYARROW, detect_csv_format, read_file
+from mapping_logic import (
+    auto_format_date_columns, build_output_frame, concat_output_frames, format_output_dates, lookup_mapping,
+    promote_header_row, to_excel_bytes, to_txt_bytes, validate_mapping,
+)
+from profiling import peak_memory_mb
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Each scenario describes the synthetic inputs to generate
+SCENARIOS = {
+    "small_csv": {"format": "csv", "files": 2, "rows": 10_000, "cols": 20, "date_cols": 2, "duplicate_headers": 2, "blank_first_row": False},
+    "wide_csv": {"format": "csv", "files": 2, "rows": 2_000, "cols": 300, "date_cols": 5, "duplicate_headers": 10, "blank_first_row": True},
+    "multi_sheet_xlsx": {"format": "xlsx", "files": 1, "sheets": 3, "rows": 2_000, "cols": 20, "date_cols": 2, "duplicate_headers": 2, "blank_first_row": False},
+    "large_csv": {"format": "csv", "files": 4, "rows": 250_000, "cols": 30, "date_cols": 3, "duplicate_headers": 3, "blank_first_row": False},
+}
+DEFAULT_SCENARIOS = ["small_csv", "wide_csv", "multi_sheet_xlsx"]
+
+# Low-cardinality values, similar to country/status/site codes in real extracts
+CATEGORIES = ["FR", "DE", "US", "IN", "CN", "Active", "Closed", "Pending", "SITE-001", "SITE-002"]
+
+def make_frame(rows, cols, date_cols, duplicate_headers, seed):
+    """
+    Builds a synthetic input DataFrame with string, date and duplicated columns.
+    """
+    rng = random.Random(seed)
+    data = {}
+    headers = []
+    for i in range(cols):
+        if i < date_cols:
+            name = f"Date {i}"
+            start = pd.Timestamp("2020-01-01")
+            values = (start + pd.to_timedelta([rng.randrange(2000) for _ in range(rows)], unit="D")).strftime("%m/%d/%Y")
+        elif i % 3 == 0:
+            name = f"Code {i}"
+            values = [rng.choice(CATEGORIES) for _ in range(rows)]
+        else:
+            name = f"Field {i}"
+            values = [f"v{rng.randrange(rows)}" for _ in range(rows)]
+        # Repeat some header names so the duplicate-header handling is exercised
+        if duplicate_headers and date_cols <= i < date_cols + duplicate_headers:
+            name = f"Field {date_cols + duplicate_headers}"
+        headers.append(name)
+        data[i] = list(values)
+    df = pd.DataFrame(data)
+    df.columns = headers
+    return df
+
+def write_frame(df, path, blank_first_row, sheet_frames=None):
+    """
+    Writes a synthetic frame (or several sheets) to CSV/XLSX. Headers are written as a data row so that
+    duplicate names survive and the empty-first-row header detection can be exercised.
+    """
+    def as_rows(frame):
+        rows = [list(frame.columns)] + frame.values.tolist()
+        if blank_first_row:
+            # Title row followed by an empty row, as in exported reports
+            rows[:0] = [["Report"] + [None] * (len(frame.columns) - 1), [None] * len(frame.columns)]
+        return pd.DataFrame(rows)
+
+    if path.endswith(".csv"):
+        as_rows(df).to_csv(path, index=False, header=False)
+    else:
+        with pd.ExcelWriter(path, engine="openpyxl") as writer:
+            for sheet, frame in (sheet_frames or {"Sheet1": df}).items():
+                as_rows(frame).to_excel(writer, index=False, header=False, sheet_name=sheet)
+
+def generate_inputs(scenario, out_dir, seed=0):
+    """
+    Generates input files, an output template and a mapping file for a scenario.
+    Returns:
+        dict: Paths to the generated inputs (file paths with their sheets), template and mapping file.
+    """
+    inputs = []
+    template_columns = None
+    for f in range(scenario["files"]):
+        sheet_names = [f"Sheet{i + 1}" for i in range(scenario.get("sheets", 1))]
+        frames = {sheet: make_frame(scenario["rows"], scenario["cols"], scenario["date_cols"], scenario["duplicate_headers"], seed + f * 100 + i)
+                  for i, sheet in enumerate(sheet_names)}
+        path = os.path.join(out_dir, f"input_{f}.{scenario['format']}")
+        first = next(iter(frames.values()))
+        write_frame(first, path, scenario["blank_first_row"], frames)
+        inputs.append({"path": path, "sheets": sheet_names if scenario["format"] == "xlsx" else [None]})
+        if template_columns is None:
+            template_columns = [c.replace("Field", "Out").replace("Code", "OutCode").replace("Date", "OutDate") for c in dict.fromkeys(first.columns)]
+            input_columns = list(dict.fromkeys(first.columns))
+    template_path = os.path.join(out_dir, "template.csv")
+    pd.DataFrame(columns=template_columns + ["Source"]).to_csv(template_path, index=False)
+    mapping_path = os.path.join(out_dir, "mapping.csv")
+    mapping_rows = [{"FileName": "", "SheetName": "", "OutputColumn": out, "InputColumn": inp} for out, inp in zip(template_columns, input_columns)]
+    pd.DataFrame(mapping_rows).to_csv(mapping_path, index=False)
+    return {"inputs": inputs, "template": template_path, "mapping": mapping_path}
+
+def run_pipeline(paths):
+    """
+    Runs the mapping pipeline headlessly, mirroring the steps in app.py / mapping_logic.py.
+    Returns:
+        dict: Per-stage seconds and peak RSS, rows, rows/sec and output sizes.
+    """
+    stages = {}
+
+    def timed(stage, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        entry = stages.setdefault(stage, {"seconds": 0.0, "peak_rss_mb": None})
+        entry["seconds"] += time.perf_counter() - start
+        entry["peak_rss_mb"] = peak_memory_mb()
+        return result
+
+    def parse(input_item, sheet):
+        if sheet:
+            return pd.read_excel(input_item["path"], sheet_name=sheet, engine="openpyxl")
+        with open(input_item["path"], "rb") as handle:
+            return read_file(handle)[0]
+
+    def detect_header(input_df):
+        input_df.columns = input_df.columns.astype(str).str.strip()
+        if input_df.iloc[0].isnull().all():
+            return promote_header_row(input_df, 1)
+        return input_df
+
+    with open(paths["template"], "rb") as handle:
+        output_columns = read_file(handle)[0].columns.tolist()
+    with open(paths["mapping"], "rb") as handle:
+        mapping_df = read_file(handle)[0]
+
+    final_dataframes = []
+    total_start = time.perf_counter()
+    for input_item in paths["inputs"]:
+        for sheet in input_item["sheets"]:
+            input_df = timed("parse", parse, input_item, sheet)
+            input_df = timed("header detect", detect_header, input_df)
+            input_df = timed("date parse", auto_format_date_columns, input_df)
+            mapping_dict = lookup_mapping(mapping_df, os.path.basename(input_item["path"]), sheet)
+            column_mapping = {col: mapping_dict.get(col) if mapping_dict.get(col) in input_df.columns else None for col in output_columns}
+            static_values = {col: "" for col in output_columns}
+            static_values["Source"] = os.path.basename(input_item["path"])
+            final_dataframes.append({
+                "label": f"{os.path.basename(input_item['path'])} - {sheet}" if sheet else os.path.basename(input_item["path"]),
+                "input_df": input_df, "column_mapping": column_mapping, "static_values": static_values,
+                "include_flags": {col: True for col in output_columns},
+                "date_format_flags": {col: "date" in col.lower() for col in output_columns},
+            })
+    errors = timed("validate", validate_mapping, final_dataframes, output_columns)
+    if errors:
+        raise RuntimeError(f"Synthetic mapping is invalid: {errors[:3]}")
+    # Dates are formatted per frame before the frames are combined, as in process_final_output
+    date_format_flags = final_dataframes[-1]["date_format_flags"]
+    frames = []
+    for file_data in final_dataframes:
+        frame = timed("mapping", build_output_frame, file_data, output_columns)
+        frames.append(timed("date parse", format_output_dates, frame, date_format_flags, {}))
+    combined_df = timed("concat", concat_output_frames, frames)
+    excel_bytes = timed("excel write", to_excel_bytes, combined_df)
+    txt_bytes = timed("txt write", to_txt_bytes, combined_df)
+    total_seconds = time.perf_counter() - total_start
+    input_rows = sum(len(file_data["input_df"]) for file_data in final_dataframes)
+    return {
+        "rows": input_rows,
+        "output_columns": len(output_columns),
+        "total_seconds": total_seconds,
+        "rows_per_sec": input_rows / total_seconds if total_seconds else None,
+        "peak_rss_mb": peak_memory_mb(),
+        "excel_bytes": excel_bytes.getbuffer().nbytes,
+        "txt_bytes": len(txt_bytes),
+        "input_bytes": sum(os.path.getsize(item["path"]) for item in paths["inputs"]),
+        "stages": stages,
+    }
+
+def run_scenario(name):
+    """
+    Generates the inputs for a scenario in a temporary directory and runs the pipeline on them.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = generate_inputs(SCENARIOS[name], tmp_dir)
+        return run_pipeline(paths)
+
+def write_reader_csv(path, size_mb, seed=0):
+    """
+    Writes a synthetic extract of roughly size_mb to path, appending chunks until the size is reached.
+    """
+    chunk = make_frame(50_000, 30, 3, 0, seed)
+    chunk.to_csv(path, index=False)
+    while os.path.getsize(path) < size_mb * 1024 * 1024:
+        chunk.to_csv(path, index=False, header=False, mode="a")
+
+def run_reader(backend, path):
+    """
+    Times one CSV reader backend on a file (run in a fresh process for a clean peak RSS).
+    """
+    start = time.perf_counter()
+    df = CSV_READERS[backend](path, detect_csv_format(path))
+    seconds = time.perf_counter() - start
+    size_mb = os.path.getsize(path) / (1024 * 1024)
+    return {"rows": len(df), "seconds": seconds, "mb_per_sec": size_mb / seconds, "peak_rss_mb": peak_memory_mb()}
+
+def run_reader_benchmark(size_mb):
+    """
+    Compares the CSV reader backends on a generated file of roughly size_mb.
+    """
+    backends = [name for name in CSV_READERS if name != "pyarrow" or HAS_PYARROW]
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "extract.csv")
+        write_reader_csv(path, size_mb)
+        print(f"Reader benchmark on {os.path.getsize(path) / (1024 * 1024):,.0f} MB CSV")
+        for backend in backends:
+            with multiprocessing.get_context("spawn").Pool(1) as pool:
+                results[backend] = pool.apply(run_reader, (backend, path))
+            result = results[backend]
+            print(f"    {backend:<8} {result['seconds']:8.2f}s  {result['mb_per_sec']:8.1f} MB/s  peak RSS {result['peak_rss_mb']:,.0f} MB  ({result['rows']:,} rows)")
+    return results
+
+# Runs in a fresh interpreter: the first AppTest run is a cold start (nothing but Streamlit imported),
+# the second a warm rerun with all modules cached
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+streamlit_import = time.perf_counter() - start
+at = AppTest.from_file(sys.argv[1], default_timeout=120)
+start = time.perf_counter(); at.run(); cold = time.perf_counter() - start
+start = time.perf_counter(); at.run(); warm = time.perf_counter() - start
+print(json.dumps({"streamlit_import_seconds": streamlit_import, "cold_seconds": cold, "warm_seconds": warm,
+                  "heavy_modules_loaded": [m for m in ("pandas", "numpy", "pyarrow", "openpyxl") if m in sys.modules]}))
+"""
+
+def run_startup_benchmark(runs=5):
+    """
+    Measures the app's cold-start (first script run in a new process) and warm-rerun times, without uploads.
+    """
+    app_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+    samples = []
+    for _ in range(runs):
+        completed = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT, app_path], capture_output=True, text=True, check=True)
+        samples.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+    median = lambda key: sorted(sample[key] for sample in samples)[len(samples) // 2]
+    results = {key: median(key) for key in ("streamlit_import_seconds", "cold_seconds", "warm_seconds")}
+    results["heavy_modules_loaded"] = samples[-1]["heavy_modules_loaded"]
+    print(f"Startup over {runs} fresh processes (median): Streamlit import {results['streamlit_import_seconds']:.3f}s, "
+          f"cold first run {results['cold_seconds']:.3f}s, warm rerun {results['warm_seconds']:.3f}s")
+    print(f"    heavy modules loaded before any upload: {', '.join(results['heavy_modules_loaded']) or 'none'}")
+    return results
+
+def compare(results, baseline, tolerance):
+    """
+    Compares results against a baseline and prints a report.
+    Returns:
+        bool: True if no scenario regressed by more than the tolerance.
+    """
+    ok = True
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            print(f"{name}: no baseline entry")
+            continue
+        ratio = result["rows_per_sec"] / base["rows_per_sec"]
+        status = "OK"
+        if ratio < 1 - tolerance:
+            status = "REGRESSION"
+            ok = False
+        print(f"{name}: {result['rows_per_sec']:,.0f} rows/s vs baseline {base['rows_per_sec']:,.0f} rows/s ({ratio:.2f}x) {status}")
+        for stage, entry in result["stages"].items():
+            base_stage = base["stages"].get(stage)
+            if base_stage and base_stage["seconds"]:
+                print(f"    {stage:<14} {entry['seconds']:8.3f}s  (baseline {base_stage['seconds']:.3f}s, {entry['seconds'] / base_stage['seconds']:.2f}x)")
+    return ok
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the column mapping pipeline on synthetic inputs.")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="Scenario to run (repeatable). Defaults to: " + ", ".join(DEFAULT_SCENARIOS))
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline.")
+    parser.add_argument("--compare", action="store_true", help="Compare results with the stored baseline; exit 1 on regression.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed rows/sec drop before flagging a regression (default 0.2).")
+    parser.add_argument("--output", help="Also write the results as JSON to this path.")
+    parser.add_argument("--readers", action="store_true", help="Benchmark the CSV reader backends instead of the pipeline.")
+    parser.add_argument("--reader-size-mb", type=float, default=100, help="Size of the CSV generated for --readers (default 100).")
+    parser.add_argument("--startup", action="store_true", help="Measure app cold-start and warm-rerun times instead of the pipeline.")
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        results = run_startup_benchmark()
+        if args.output:
+            with open(args.output, "w") as handle:
+                json.dump(results, handle, indent=2)
+        return 0
+
+    if args.readers:
+        results = run_reader_benchmark(args.reader_size_mb)
+        if args.output:
+            with open(args.output, "w") as handle:
+                json.dump(results, handle, indent=2)
+        return 0
+
+    results = {}
+    for name in args.scenario or DEFAULT_SCENARIOS:
+        # Each scenario runs in a fresh process so that peak RSS is not carried over between scenarios
+        with multiprocessing.get_context("spawn").Pool(1) as pool:
+            results[name] = pool.apply(run_scenario, (name,))
+        result = results[name]
+        print(f"{name}: {result['rows']:,} rows in {result['total_seconds']:.2f}s ({result['rows_per_sec']:,.0f} rows/s), "
+              f"peak RSS {result['peak_rss_mb']:.0f} MB, xlsx {result['excel_bytes'] / 1e6:.1f} MB, txt {result['txt_bytes'] / 1e6:.1f} MB")
+
+    if args.output:
+        with open(args.output, "w") as handle:
+            json.dump(results, handle, indent=2)
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(BASELINE_PATH):
+            with open(BASELINE_PATH) as handle:
+                baseline = json.load(handle)
+        baseline.update(results)
+        with open(BASELINE_PATH, "w") as handle:
+            json.dump(baseline, handle, indent=2)
+        print(f"Baseline saved to {BASELINE_PATH}")
+    if args.compare:
+        if not os.path.exists(BASELINE_PATH):
+            print("No baseline found; run with --save-baseline first.")
+            return 1
+        with open(BASELINE_PATH) as handle:
+            baseline = json.load(handle)
+        return 0 if compare(results, baseline, args.tolerance) else 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
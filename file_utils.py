@@ -4,29 +4,277 @@ file_utils.py
 Utility functions for reading files and ensuring required columns are present.
 """
 
+import csv
+import importlib.util
+import io
+import os
+from functools import lru_cache
 import pandas as pd
 import streamlit as st
+from app_logging import get_logger
+from profiling import stage_timer
 
-def read_file(file):
+logger = get_logger("file_utils")
+
+# String storage modes for ingested data: "default" (plain str dtype), "arrow" (Arrow-backed strings)
+# and "categorical" (low-cardinality columns converted to categoricals)
+STRING_STORAGE_MODES = ("default", "arrow", "categorical")
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+# CSV reader backend: "auto" (pyarrow if installed, falling back to the C engine), "pyarrow" or "c"
+CSV_BACKEND = os.environ.get("COLUMN_MAPPING_CSV_BACKEND", "auto")
+CSV_SAMPLE_BYTES = 64 * 1024
+
+def _mangle_duplicate_columns(columns):
+    """
+    Names blank headers and renames duplicate column names the way the pandas C engine does
+    ("Unnamed: 2"; "a", "a.1", "a.2").
+    """
+    seen = {}
+    result = []
+    for i, col in enumerate(columns):
+        col = str(col) or f"Unnamed: {i}"
+        name = col
+        while name in seen:
+            seen[col] += 1
+            name = f"{col}.{seen[col]}"
+        seen[name] = 0
+        result.append(name)
+    return result
+
+def _read_csv_c(source, csv_format):
+    return pd.read_csv(source, dtype=str, low_memory=False, memory_map=isinstance(source, str),
+                       sep=csv_format["sep"], quotechar=csv_format["quotechar"], encoding=csv_format["encoding"])
+
+def _read_csv_header(source, csv_format):
+    text = _read_sample(source).decode(csv_format["encoding"], errors="ignore")
+    return next(row for row in csv.reader(io.StringIO(text), delimiter=csv_format["sep"], quotechar=csv_format["quotechar"]) if row)
+
+def _read_csv_pyarrow(source, csv_format):
+    # pyarrow.csv is called directly: pandas' pyarrow engine infers types before casting to str,
+    # which turns "007" into "7" and "1.50" into "1.5". Every column is read as string instead,
+    # under positional names, and the header is taken from the sniffed sample.
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    from pandas._libs.parsers import STR_NA_VALUES
+    header = _read_csv_header(source, csv_format)
+    names = [f"f{i}" for i in range(len(header))]
+    # pyarrow handles a UTF-8 BOM itself and does not know the "utf-8-sig" codec name
+    encoding = "utf-8" if csv_format["encoding"] == "utf-8-sig" else csv_format["encoding"]
+    table = pa_csv.read_csv(
+        source,
+        read_options=pa_csv.ReadOptions(column_names=names, encoding=encoding),
+        parse_options=pa_csv.ParseOptions(delimiter=csv_format["sep"], quote_char=csv_format["quotechar"], newlines_in_values=True),
+        # Same missing-value markers as the C engine
+        convert_options=pa_csv.ConvertOptions(column_types={name: pa.string() for name in names},
+                                              null_values=sorted(STR_NA_VALUES), strings_can_be_null=True),
+    )
+    df = table.slice(1).to_pandas()
+    df.columns = _mangle_duplicate_columns(header)
+    return df
+
+CSV_READERS = {"pyarrow": _read_csv_pyarrow, "c": _read_csv_c}
+DEFAULT_CSV_FORMAT = {"encoding": "utf-8", "sep": ",", "quotechar": '"', "bom": False}
+
+class CsvFormatError(ValueError):
+    """
+    Raised when the sample of a CSV shows it cannot be parsed (binary content, inconsistent rows).
+    """
+
+def _read_sample(source):
+    if isinstance(source, str):
+        with open(source, "rb") as handle:
+            return handle.read(CSV_SAMPLE_BYTES)
+    position = source.tell()
+    sample = source.read(CSV_SAMPLE_BYTES)
+    source.seek(position)
+    return sample
+
+def sniff_csv_sample(sample):
+    """
+    Detects encoding, BOM, delimiter and quote character from the first bytes of a CSV.
+
+    Args:
+        sample (bytes): Start of the file.
+
+    Returns:
+        dict: {"encoding": ..., "sep": ..., "quotechar": ..., "bom": ...}
+
+    Raises:
+        CsvFormatError: If the sample is binary (e.g. an Excel file renamed to .csv), has rows with more
+            fields than the header, or collapses into a single column although it is delimited.
+    """
+    if sample.startswith((b"\xff\xfe", b"\xfe\xff")):
+        # UTF-16 text contains NUL bytes, so check its BOM before the binary check
+        bom = True
+        encoding = "utf-16"
+    elif sample.startswith(b"PK\x03\x04") or b"\x00" in sample:
+        raise CsvFormatError("File looks binary (e.g. an Excel workbook saved with a .csv extension), not a text CSV")
+    elif sample.startswith(b"\xef\xbb\xbf"):
+        bom = True
+        encoding = "utf-8-sig"
+    else:
+        bom = False
+        try:
+            # Ignore a multi-byte character cut off at the end of the sample
+            (sample if len(sample) < CSV_SAMPLE_BYTES else sample[:-4]).decode("utf-8")
+            encoding = "utf-8"
+        except UnicodeDecodeError:
+            # Windows exports are usually cp1252 (€, œ, Š, curly quotes in 0x80-0x9F); latin-1 decodes
+            # any byte sequence and is the fallback for the few bytes cp1252 leaves undefined
+            try:
+                sample.decode("cp1252")
+                encoding = "cp1252"
+            except UnicodeDecodeError:
+                encoding = "latin-1"
+    text = sample.decode(encoding, errors="ignore").lstrip("\ufeff")
+    if len(sample) >= CSV_SAMPLE_BYTES and "\n" in text:
+        # Drop the last (possibly truncated) line
+        text = text[:text.rfind("\n")]
+    csv_format = dict(DEFAULT_CSV_FORMAT, encoding=encoding, bom=bom)
+    try:
+        dialect = csv.Sniffer().sniff(text, delimiters=",;\t|")
+        csv_format["sep"] = dialect.delimiter
+        csv_format["quotechar"] = dialect.quotechar or '"'
+    except csv.Error:
+        pass
+    # Shorter rows are fine (missing trailing fields are read as empty); longer rows fail the full parse
+    rows = [row for row in csv.reader(io.StringIO(text), delimiter=csv_format["sep"], quotechar=csv_format["quotechar"]) if row]
+    if rows:
+        width = len(rows[0])
+        too_long = sum(1 for row in rows[1:] if len(row) > width)
+        if too_long:
+            raise CsvFormatError(f"{too_long} of the first {len(rows) - 1} rows have more fields than the {width}-column header "
+                                 f"with delimiter '{csv_format['sep']}'")
+        if width == 1:
+            lines = [line for line in text.splitlines() if line.strip()][:20]
+            for candidate in ",;\t|":
+                counts = {line.count(candidate) for line in lines}
+                if candidate != csv_format["sep"] and len(lines) > 1 and len(counts) == 1 and counts != {0}:
+                    raise CsvFormatError(f"Every line contains '{candidate}' the same number of times, but the delimiter could not be "
+                                         f"detected, so the file would be read as a single column")
+    return csv_format
+
+@lru_cache(maxsize=256)
+def _sniff_cached(path, content_hash):
+    return sniff_csv_sample(_read_sample(path))
+
+def detect_csv_format(source, content_hash=None):
+    """
+    Sniffs the CSV format from the first few KB of a file. Results are cached per content hash,
+    so reruns and repeated uploads of the same file do not sniff again.
+
+    Args:
+        source: File path or binary file-like object (position is restored).
+        content_hash (str): Content hash of the file, if known.
+
+    Returns:
+        dict: {"encoding": ..., "sep": ..., "quotechar": ..., "bom": ...}
+    """
+    if content_hash and isinstance(source, str):
+        return dict(_sniff_cached(source, content_hash))
+    return sniff_csv_sample(_read_sample(source))
+
+def read_csv(source, backend=None, csv_format=None):
+    """
+    Reads a CSV as all-string columns with the configured backend, falling back to the C engine on failure.
+
+    Args:
+        source: File path or file-like object.
+        backend (str): "auto", "pyarrow" or "c". Defaults to CSV_BACKEND.
+        csv_format (dict): Sniffed format (see detect_csv_format). Defaults to comma-delimited UTF-8.
+
+    Returns:
+        pd.DataFrame: Parsed data.
+    """
+    backend = backend or CSV_BACKEND
+    csv_format = csv_format or DEFAULT_CSV_FORMAT
+    if backend == "auto":
+        order = ["pyarrow", "c"] if HAS_PYARROW else ["c"]
+    else:
+        order = [backend] if backend == "c" else [backend, "c"]
+    for i, name in enumerate(order):
+        try:
+            return CSV_READERS[name](source, csv_format)
+        except Exception:
+            if i == len(order) - 1:
+                raise
+            logger.warning("CSV backend %s failed; falling back to %s", name, order[i + 1], exc_info=True)
+            if not isinstance(source, str):
+                source.seek(0)
+
+def optimize_string_columns(df, string_storage="default", max_cardinality_ratio=0.5):
+    """
+    Converts string columns to a more compact representation and records the memory saved in df.attrs.
+
+    Args:
+        df (pd.DataFrame): DataFrame with string columns.
+        string_storage (str): One of STRING_STORAGE_MODES.
+        max_cardinality_ratio (float): In "categorical" mode, columns with at most this ratio of
+            distinct values to rows are converted to categoricals.
+
+    Returns:
+        pd.DataFrame: The converted DataFrame. df.attrs["string_storage"] holds the mode and bytes before/after.
+    """
+    if df is None or string_storage == "default":
+        return df
+    if string_storage == "arrow" and not HAS_PYARROW:
+        logger.warning("pyarrow is not installed; keeping default string storage")
+        return df
+    bytes_before = int(df.memory_usage(deep=True).sum())
+    max_distinct = max(1, int(len(df) * max_cardinality_ratio))
+    # Positional access so duplicate column names are handled
+    for col in range(df.shape[1]):
+        series = df.iloc[:, col]
+        if not (pd.api.types.is_object_dtype(series.dtype) or isinstance(series.dtype, pd.StringDtype)):
+            continue
+        if string_storage == "arrow":
+            df.isetitem(col, series.astype("string[pyarrow]"))
+        elif string_storage == "categorical" and series.nunique(dropna=True) <= max_distinct:
+            df.isetitem(col, series.astype("category"))
+    bytes_after = int(df.memory_usage(deep=True).sum())
+    df.attrs["string_storage"] = {"mode": string_storage, "bytes_before": bytes_before, "bytes_after": bytes_after}
+    return df
+
+def read_file(file, string_storage="default"):
     """
     Efficiently read CSV or Excel file as all-string columns to avoid dtype warnings and speed up loading.
 
     Args:
-        file: Uploaded file object (CSV or Excel).
+        file: Uploaded file object or staged upload (CSV or Excel). Staged uploads are read from their path.
+        string_storage (str): One of STRING_STORAGE_MODES; see optimize_string_columns.
 
     Returns:
         tuple: (DataFrame, list of validation errors)
     """
     try:
+        source = getattr(file, "path", file)
         if file.name.endswith(".csv"):
-            df = pd.read_csv(file, dtype=str, low_memory=False)
+            with stage_timer("sniff", file.name):
+                csv_format = detect_csv_format(source, getattr(file, "sha256", None))
+            df = read_csv(source, csv_format=csv_format)
+            df.attrs["csv_format"] = csv_format
         else:
-            df = pd.read_excel(file, dtype=str)
-        return df, []
+            df = pd.read_excel(source, dtype=str)
+        return optimize_string_columns(df, string_storage), []
     except Exception as e:
+        logger.exception("Error reading %s", file.name)
         st.error(f"Error reading {file.name}: {str(e)}")
         return None, []
 
+def list_sheet_names(file):
+    """
+    Returns the sheet names of an Excel file without reading any sheet data.
+
+    Args:
+        file: Uploaded file object or staged upload (Excel).
+
+    Returns:
+        list: Sheet names.
+    """
+    with pd.ExcelFile(getattr(file, "path", file)) as xls:
+        return xls.sheet_names
+
 def fill_missing_columns(df, required_cols):
     """
     Ensures all required columns exist in the DataFrame, filling missing ones with empty strings.
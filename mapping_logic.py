@@ -4,9 +4,28 @@ mapping_logic.py
 Contains the main logic for mapping, processing, and exporting data using Streamlit UI.
 """
 
+import csv
+import io
+import time
+import warnings
+import numpy as np
 import pandas as pd
 import streamlit as st
-from file_utils import read_file, fill_missing_columns
+from file_utils import read_file, fill_missing_columns, optimize_string_columns
+from profiling import stage_timer, record_file_stats
+from app_logging import get_logger, log_debug_payload
+from transforms import EXPRESSION_PREFIX, TransformError, compile_expression, is_expression
+from upload_staging import content_hash, stage_upload
+from resource_governor import estimate_job_bytes, governed_job
+from mapping_profiles import entry_keys, header_signature, template_fingerprint, load_profile, save_profile
+from row_dedup import KEEP_FIRST, KEEP_LAST, RowDeduplicator
+from output_profile import OutputProfiler
+from ui_sections import show_output_profile
+
+logger = get_logger("mapping_logic")
+
+APPLIED_PROFILE_KEY = "_applied_mapping_profile"
+EXPRESSION_OPTION = "--Expression--"
 
 # Utility: Deduplicate columns
 
@@ -30,9 +49,45 @@ def deduplicate_columns(columns):
             new_cols.append(col_str)
     return new_cols
 
+def promote_header_row(input_df, row_idx):
+    """
+    Uses the given row as the column header (whitespace stripped, duplicates suffixed) and drops the rows above it.
+    Args:
+        input_df (pd.DataFrame): Input DataFrame.
+        row_idx (int): 0-based row index holding the column names.
+    Returns:
+        pd.DataFrame: DataFrame with the new header.
+    """
+    # STRIP WHITESPACE BEFORE DEDUPLICATION
+    input_df.columns = input_df.iloc[row_idx].astype(str).str.strip()
+    input_df.columns = deduplicate_columns(input_df.columns)
+    return input_df[row_idx+1:].reset_index(drop=True)
+
+def lookup_mapping(mapping_df, file_name, sheet_name):
+    """
+    Returns the OutputColumn -> InputColumn entries of a mapping file that apply to one file/sheet.
+    Rows with a blank or 'NA' FileName/SheetName apply to all files/sheets.
+    Args:
+        mapping_df (pd.DataFrame): Mapping DataFrame (FileName, SheetName, OutputColumn, InputColumn).
+        file_name (str): Input file name.
+        sheet_name (str): Sheet name, or None for CSV files.
+    Returns:
+        dict: Mapping of output column to input column.
+    """
+    mapping_df['FileName_norm'] = mapping_df['FileName'].fillna("").astype(str).str.strip().str.lower()
+    mapping_df['SheetName_norm'] = mapping_df['SheetName'].fillna("").astype(str).str.strip().str.lower()
+    file_name_norm = str(file_name).strip().lower()
+    sheet_name_norm = str(sheet_name or "").strip().lower()
+    # Allow mapping to apply to all files if FileName is blank or 'NA', and all sheets if SheetName is blank or 'NA'
+    file_mapping = mapping_df[
+        ((mapping_df['FileName_norm'] == file_name_norm) | (mapping_df['FileName_norm'].isin(["", "na"]))) &
+        ((mapping_df['SheetName_norm'] == sheet_name_norm) | (mapping_df['SheetName_norm'].isin(["", "na"])))
+    ]
+    return dict(zip(file_mapping['OutputColumn'], file_mapping['InputColumn']))
+
 # Main function: Handles mapping UI and logic
 
-def process_mapping_tabs(input_file_sheets, output_file, mapping_file, mapping_file_valid, mapping_df, output_columns):
+def process_mapping_tabs(input_file_sheets, output_file, mapping_file, mapping_file_valid, mapping_df, output_columns, string_storage="default"):
     """
     Handles the mapping UI and logic for each file/sheet tab. Returns final_dataframes and output_filename.
     Optimized for speed: uses Streamlit caching for file reads and DataFrame operations.
@@ -43,17 +98,19 @@ def process_mapping_tabs(input_file_sheets, output_file, mapping_file, mapping_f
         mapping_file_valid (bool): Whether mapping file is valid.
         mapping_df (pd.DataFrame): Mapping DataFrame.
         output_columns (list): List of output column names.
+        string_storage (str): String storage mode for input data (see file_utils.STRING_STORAGE_MODES).
     Returns:
         tuple: (final_dataframes, output_filename)
     """
+    # The file argument is not hashed (leading underscore); the content hash is the cache key
     @st.cache_data(show_spinner=False, max_entries=20)
-    def cached_read_file(file):
-        return read_file(file)
+    def cached_read_file(_file, file_hash, string_storage):
+        return read_file(_file, string_storage)
 
     @st.cache_data(show_spinner=False, max_entries=20)
-    def cached_read_excel(file, sheet_name, usecols):
+    def cached_read_excel(_file, file_hash, sheet_name, usecols, string_storage):
         # Optimize Excel reading: use openpyxl, only read necessary columns, avoid dtype conversion if not needed
-        return pd.read_excel(file, sheet_name=sheet_name, usecols=usecols, engine='openpyxl')
+        return optimize_string_columns(pd.read_excel(getattr(_file, "path", _file), sheet_name=sheet_name, usecols=usecols, engine='openpyxl'), string_storage)
 
     final_dataframes = []
     active_file_sheets = input_file_sheets
@@ -61,8 +118,36 @@ def process_mapping_tabs(input_file_sheets, output_file, mapping_file, mapping_f
     if not tab_labels:
         st.info("No files/sheets to map. Please upload or add a file.")
         return [], st.session_state.get("output_file_name", "final_output")
+    # Read every file/sheet up front so saved profiles can be matched before any widget is created
+    input_dfs = []
+    for item in active_file_sheets:
+        with stage_timer("parse", item["label"]):
+            if item["sheet"]:
+                input_dfs.append(cached_read_excel(item["file"], content_hash(item["file"]), item["sheet"], None, string_storage))  # Read all columns
+            else:
+                input_dfs.append(cached_read_file(item["file"], content_hash(item["file"]), string_storage)[0])
+    # Files that failed to read (e.g. rejected by the CSV sniffer) already showed an error; skip them
+    readable = [i for i, input_df in enumerate(input_dfs) if input_df is not None]
+    if len(readable) < len(input_dfs):
+        active_file_sheets = [active_file_sheets[i] for i in readable]
+        input_dfs = [input_dfs[i] for i in readable]
+        tab_labels = [tab_labels[i] for i in readable]
+        if not tab_labels:
+            return [], st.session_state.get("output_file_name", "final_output")
+    signatures = [header_signature(input_df.columns) for input_df in input_dfs]
+    fingerprint = template_fingerprint(output_columns, signatures)
+    profile = load_profile(fingerprint)
+    profile_applied = st.session_state.get(APPLIED_PROFILE_KEY) == fingerprint
+    if profile and not profile_applied:
+        info_col, button_col = st.columns([4, 1])
+        with info_col:
+            st.info(f"🔁 A saved mapping profile matches this template and these input headers (saved {time.strftime('%Y-%m-%d %H:%M', time.localtime(profile['saved_at']))}).")
+        with button_col:
+            if st.button("Restore saved mapping", key="restore_mapping_profile"):
+                restore_profile_state(profile, active_file_sheets, signatures, output_columns)
+                st.rerun()
     tabs = st.tabs(tab_labels)
-    for idx, (item, tab) in enumerate(zip(active_file_sheets, tabs)):
+    for idx, (item, tab, input_df, signature) in enumerate(zip(active_file_sheets, tabs, input_dfs, signatures)):
         with tab:
             st.subheader(f"Mapping for: {item['label']}")
             # Single master checkbox for select/unselect all
@@ -76,44 +161,46 @@ def process_mapping_tabs(input_file_sheets, output_file, mapping_file, mapping_f
                 # Update all columns' state directly when the checkbox is toggled
                 for col in output_columns:
                     st.session_state[f"{item['label']}_{col}_inc_{idx}"] = master_value
-            if item["sheet"]:
-                input_df = cached_read_excel(item["file"], item["sheet"], None)  # Read all columns
-            else:
-                input_df, validation_errors = cached_read_file(item["file"])
-            # --- STRIP WHITESPACE BEFORE DEDUPLICATION ---
-            input_df.columns = input_df.columns.str.strip()
+            storage_stats = input_df.attrs.get("string_storage")
+            if storage_stats:
+                saved_mb = (storage_stats["bytes_before"] - storage_stats["bytes_after"]) / 1e6
+                st.caption(f"💾 {storage_stats['mode'].capitalize()} storage: {storage_stats['bytes_after'] / 1e6:.1f} MB in memory ({saved_mb:.1f} MB saved)")
+            csv_format = input_df.attrs.get("csv_format")
+            if csv_format:
+                delimiter = {"\t": "tab", " ": "space"}.get(csv_format["sep"], csv_format["sep"])
+                st.caption(f"🔎 Detected CSV format: {csv_format['encoding']}{' with BOM' if csv_format['bom'] else ''}, delimiter '{delimiter}', quote {csv_format['quotechar']}")
             # Option for user to specify the cell (row/col) where column names start
             col_header_cell = st.text_input(
                 "(Optional) Enter row number where column names start (e.g., 4):",
                 value="",
                 key=f"{item['label']}_col_header_cell_{idx}"
             )
-            # If user provides a cell reference or row number, adjust DataFrame accordingly
-            if col_header_cell:
-                import re
-                match = re.match(r"(\d+)", col_header_cell.strip())
-                if match:
-                    row_part = match.group(1)
-                    row_idx = int(row_part) - 1  # Excel is 1-based, pandas is 0-based
-                    if 0 <= row_idx < len(input_df):
-                        if input_df.iloc[row_idx].isnull().all():
-                            st.warning(f"Row {row_part} is all empty/NaN. Please check your file.")
+            with stage_timer("header detect", item["label"]):
+                # --- STRIP WHITESPACE BEFORE DEDUPLICATION ---
+                input_df.columns = input_df.columns.str.strip()
+                # If user provides a cell reference or row number, adjust DataFrame accordingly
+                if col_header_cell:
+                    import re
+                    match = re.match(r"(\d+)", col_header_cell.strip())
+                    if match:
+                        row_part = match.group(1)
+                        row_idx = int(row_part) - 1  # Excel is 1-based, pandas is 0-based
+                        if 0 <= row_idx < len(input_df):
+                            if input_df.iloc[row_idx].isnull().all():
+                                st.warning(f"Row {row_part} is all empty/NaN. Please check your file.")
+                            else:
+                                input_df = promote_header_row(input_df, row_idx)
                         else:
-                            # STRIP WHITESPACE BEFORE DEDUPLICATION
-                            input_df.columns = input_df.iloc[row_idx].astype(str).str.strip()
-                            input_df.columns = deduplicate_columns(input_df.columns)
-                            input_df = input_df[row_idx+1:].reset_index(drop=True)
+                            st.warning(f"Row {row_part} is out of bounds for this file.")
                     else:
-                        st.warning(f"Row {row_part} is out of bounds for this file.")
+                        st.warning("Invalid row number. Please enter a valid integer (e.g., 4). Only row number is supported.")
                 else:
-                    st.warning("Invalid row number. Please enter a valid integer (e.g., 4). Only row number is supported.")
-            else:
-                # Fallback: if first row is empty, use current logic
-                if input_df.iloc[0].isnull().all():
-                    # STRIP WHITESPACE BEFORE DEDUPLICATION
-                    input_df.columns = input_df.iloc[1].astype(str).str.strip()
-                    input_df.columns = deduplicate_columns(input_df.columns)
-                    input_df = input_df[2:].reset_index(drop=True)
+                    # Fallback: if first row is empty, use current logic
+                    if input_df.iloc[0].isnull().all():
+                        input_df = promote_header_row(input_df, 1)
+            record_file_stats(item["label"], rows=len(input_df), nbytes=getattr(item["file"], "size", None),
+                              memory_saved_bytes=storage_stats["bytes_before"] - storage_stats["bytes_after"] if storage_stats else None,
+                              csv_format=csv_format)
             # Only keep columns from input file, not output template
             input_columns = input_df.columns.tolist()
             # Build a mapping of base column names to their occurrences (for deduplication)
@@ -125,42 +212,20 @@ def process_mapping_tabs(input_file_sheets, output_file, mapping_file, mapping_f
                 else:
                     base_name = base
                 col_occurrences.setdefault(base_name, []).append(col)
-            # Add logging to verify col_occurrences and mapping logic
-            import logging
-            logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
-            # Log col_occurrences after it is populated
-            logging.debug(f"col_occurrences: {col_occurrences}")
-            # Add detailed logging to debug mapping logic
-            logging.debug(f"Input columns (deduplicated): {input_columns}")
-            logging.debug(f"col_occurrences: {col_occurrences}")
-            for col in input_df.columns:
-                col_str = str(col)
-                if "date" in col_str.lower():
-                    try:
-                        parsed = pd.to_datetime(input_df[col], errors='coerce', dayfirst=False)
-                        if parsed.notna().sum() > len(input_df) // 2:
-                            input_df[col] = parsed.dt.strftime('%Y-%m-%d')
-                    except Exception:
-                        pass
+            # Payload is only built when DEBUG is enabled and this call is sampled
+            log_debug_payload(logger, f"Column occurrences for {item['label']}", lambda: {"input_columns": input_columns, "col_occurrences": col_occurrences})
+            with stage_timer("date parse", item["label"]):
+                input_df = auto_format_date_columns(input_df)
             column_mapping = {col: None for col in output_columns}
             include_flags = {col: True for col in output_columns}
             static_values = {col: "" for col in output_columns}
             date_format_flags = {}
             active_filters = {}
             mapping_dict = {}
-            if mapping_df is not None and mapping_file_valid:
-                file_name = item["file"].name
-                sheet_name = item["sheet"] or ""
-                mapping_df['FileName_norm'] = mapping_df['FileName'].fillna("").astype(str).str.strip().str.lower()
-                mapping_df['SheetName_norm'] = mapping_df['SheetName'].fillna("").astype(str).str.strip().str.lower()
-                file_name_norm = str(file_name).strip().lower()
-                sheet_name_norm = str(sheet_name).strip().lower()
-                # Allow mapping to apply to all files if FileName is blank or 'NA', and all sheets if SheetName is blank or 'NA'
-                file_mapping = mapping_df[
-                    ((mapping_df['FileName_norm'] == file_name_norm) | (mapping_df['FileName_norm'].isin(["", "na"]))) &
-                    ((mapping_df['SheetName_norm'] == sheet_name_norm) | (mapping_df['SheetName_norm'].isin(["", "na"])))
-                ]
-                mapping_dict = dict(zip(file_mapping['OutputColumn'], file_mapping['InputColumn']))
+            filter_selections = {}
+            # A restored profile already holds every widget value, so the mapping file is not needed
+            if mapping_df is not None and mapping_file_valid and not profile_applied:
+                mapping_dict = lookup_mapping(mapping_df, item["file"].name, item["sheet"])
             # Header row for mapping UI
             header_cols = st.columns([1, 2, 3, 2, 2.5, 2])
             with header_cols[0]:
@@ -183,19 +248,28 @@ def process_mapping_tabs(input_file_sheets, output_file, mapping_file, mapping_f
                     st.markdown(f"<span style='line-height: 2.5'>{col}</span>", unsafe_allow_html=True)
                 with cols[2]:
                     # Always use stripped input_columns for mapping options
-                    mapping_options = ["--Select--", "--Blank--"] + input_columns
+                    mapping_options = ["--Select--", "--Blank--", EXPRESSION_OPTION] + input_columns
+                    map_key = f"{item['label']}_{col}_map_{idx}"
+                    # Drop restored values that are not available for this file (e.g. a different header row)
+                    if map_key in st.session_state and st.session_state[map_key] not in mapping_options:
+                        del st.session_state[map_key]
                     default_map = mapping_dict.get(col, "--Select--")
+                    # Mapping files store transform expressions as "expr:..." in InputColumn
+                    default_expr = ""
+                    if is_expression(default_map):
+                        default_expr = default_map.strip()[len(EXPRESSION_PREFIX):].strip()
+                        default_map = EXPRESSION_OPTION
                     # If default_map is not in mapping_options, try stripping it
                     if default_map not in mapping_options and isinstance(default_map, str):
                         default_map = default_map.strip()
-                    mapped_col = st.selectbox("Map to Input Column", mapping_options, index=mapping_options.index(default_map) if default_map in mapping_options else 0, key=f"{item['label']}_{col}_map_{idx}", label_visibility="collapsed")
+                    mapped_col = st.selectbox("Map to Input Column", mapping_options, index=mapping_options.index(default_map) if default_map in mapping_options else 0, key=map_key, label_visibility="collapsed")
                     # --- FIXED LOGIC: Robust to whitespace and matches deduplicated columns ---
                     mapped_col_original = mapped_col  # Save for UI display
                     if mapped_col:
                         mapped_col = mapped_col.strip()
-                    # --- FIX: If user selects '--Blank--', preserve it exactly ---
-                    if mapped_col == "--Blank--":
-                        pass  # Do not change mapped_col if it's --Blank--
+                    # --- FIX: If user selects '--Blank--' or an expression, preserve it exactly ---
+                    if mapped_col in ("--Blank--", EXPRESSION_OPTION):
+                        pass  # Do not change mapped_col if it's --Blank-- or --Expression--
                     else:
                         col_occurrences_stripped = {k.strip(): [c.strip() for c in v] for k, v in col_occurrences.items()}
                         input_columns_stripped = [c.strip() for c in input_columns]
@@ -210,13 +284,23 @@ def process_mapping_tabs(input_file_sheets, output_file, mapping_file, mapping_f
                                 else:
                                     mapped_col = None
                     # Defensive: If mapped_col is not in input_columns and not --Blank--, set mapped_col to None
-                    if mapped_col not in input_columns and mapped_col != "--Blank--":
+                    if mapped_col not in input_columns and mapped_col not in ("--Blank--", EXPRESSION_OPTION):
                         mapped_col = None
                 with cols[3]:
-                    static_val = st.text_input("Static Value", static_values[col], key=f"{item['label']}_{col}_static_{idx}", label_visibility="collapsed")
+                    if mapped_col == EXPRESSION_OPTION:
+                        # Expressions replace the static value; stored in the mapping as "expr:<expression>"
+                        expression = st.text_input("Expression", default_expr, key=f"{item['label']}_{col}_expr_{idx}", label_visibility="collapsed",
+                                                   placeholder='e.g. concat(trim([First Name]), " ", [Last Name])',
+                                                   help="Functions: concat, trim, upper, lower, coalesce, split, left, right, replace. Reference input columns as [Column Name].")
+                        mapped_col = EXPRESSION_PREFIX + expression.strip()
+                        static_val = ""
+                    else:
+                        static_val = st.text_input("Static Value", static_values[col], key=f"{item['label']}_{col}_static_{idx}", label_visibility="collapsed")
                 with cols[4]:
                     # Use the resolved mapped_col for filter UI and checks
-                    if mapped_col in ("--Select--", "--Blank--") or not mapped_col:
+                    if is_expression(mapped_col):
+                        st.caption("Filtering is not available for expressions.")
+                    elif mapped_col in ("--Select--", "--Blank--") or not mapped_col:
                         st.caption("Select an input column to enable filtering.")
                     elif mapped_col not in input_df.columns:
                         st.caption(f"Column '{mapped_col}' not found in input data.")
@@ -226,6 +310,8 @@ def process_mapping_tabs(input_file_sheets, output_file, mapping_file, mapping_f
                             unique_vals = input_df[mapped_col].astype(str).unique().tolist()
                             if len(unique_vals) < 500:
                                 filter_key = f"{item['label']}_{col}_filter_{idx}"
+                                if filter_key in st.session_state and not set(st.session_state[filter_key]).issubset(unique_vals):
+                                    st.session_state[filter_key] = [val for val in st.session_state[filter_key] if val in unique_vals]
                                 filter_values = st.multiselect(
                                     "Filter values (optional)",
                                     options=unique_vals,
@@ -234,12 +320,13 @@ def process_mapping_tabs(input_file_sheets, output_file, mapping_file, mapping_f
                                 )
                                 if filter_values:
                                     active_filters[mapped_col] = filter_values
+                                    filter_selections[col] = filter_values
                             else:
                                 st.caption("Too many unique values to filter interactively.")
                         else:
                             st.caption(f"Column '{mapped_col}' not found or invalid in input data.")
                 with cols[5]:
-                    show_date_checkbox = ("date" in col.lower() or (mapped_col and mapped_col != "--Select--" and "date" in mapped_col.lower()))
+                    show_date_checkbox = ("date" in col.lower() or (mapped_col and mapped_col != "--Select--" and not is_expression(mapped_col) and "date" in mapped_col.lower()))
                     if show_date_checkbox:
                         date_format_flags[col] = st.checkbox("Format as yyyy-mm-dd", value=True, key=f"{item['label']}_{col}_datefmt_{idx}")
                     else:
@@ -252,14 +339,320 @@ def process_mapping_tabs(input_file_sheets, output_file, mapping_file, mapping_f
             for filter_col, filter_vals in active_filters.items():
                 # Defensive: Only filter if filter_col is in input_df.columns
                 if filter_vals and filter_col in filtered_df.columns:
-                    filtered_df = filtered_df[filtered_df[filter_col].astype(str).isin(filter_vals)]
-            final_dataframes.append({"file": item["file"], "label": item["label"], "sheet": item.get("sheet"), "input_df": filtered_df, "column_mapping": column_mapping, "include_flags": include_flags, "static_values": static_values, "date_format_flags": date_format_flags})
+                    filtered_df = filtered_df[str_isin(filtered_df[filter_col], filter_vals)]
+            profile_entry = {"header_row": col_header_cell, "columns": {
+                col: {"inc": include_flags[col], "map": st.session_state.get(f"{item['label']}_{col}_map_{idx}", "--Select--"), "static": static_values[col],
+                      "expr": st.session_state.get(f"{item['label']}_{col}_expr_{idx}", ""), "filter": filter_selections.get(col, []), "datefmt": date_format_flags.get(col, False)}
+                for col in output_columns}}
+            final_dataframes.append({"file": item["file"], "label": item["label"], "sheet": item.get("sheet"), "input_df": filtered_df, "column_mapping": column_mapping, "include_flags": include_flags, "static_values": static_values, "date_format_flags": date_format_flags, "string_storage": string_storage, "header_signature": signature, "profile_entry": profile_entry})
     output_filename = st.text_input("📄 Enter Output File Name:", value="final_output", help="This will be the name of your output Excel and TXT files", key="output_file_name")
     return final_dataframes, output_filename
 
+def restore_profile_state(profile, input_file_sheets, signatures, output_columns):
+    """
+    Writes the widget values of a saved mapping profile into session state, so the next rerun
+    renders every tab (header row, include, mapping, expression, static value, filter, date flag) as saved.
+    Args:
+        profile (dict): Saved profile (see mapping_profiles).
+        input_file_sheets (list): List of dicts with file/sheet info.
+        signatures (list): Header signature of each file/sheet.
+        output_columns (list): List of output column names.
+    """
+    for idx, (item, signature, key) in enumerate(zip(input_file_sheets, signatures, entry_keys(signatures))):
+        # Files/sheets beyond those saved with the same headers get the settings of the first one
+        entry = profile["entries"].get(key) or profile["entries"].get(f"{signature}#0")
+        if not entry:
+            continue
+        label = item["label"]
+        st.session_state[f"{label}_col_header_cell_{idx}"] = entry.get("header_row", "")
+        columns = {col: state for col, state in entry["columns"].items() if col in output_columns}
+        for col, state in columns.items():
+            for kind in ("inc", "map", "expr", "static", "filter", "datefmt"):
+                if kind in state:
+                    st.session_state[f"{label}_{col}_{kind}_{idx}"] = state[kind]
+        # Keep the master checkbox in sync so it does not override the restored include flags
+        master_key = f"{label}_master_select_{idx}"
+        all_included = all(state.get("inc", True) for state in columns.values())
+        if master_key in st.session_state or not all_included:
+            st.session_state[master_key] = all_included
+    st.session_state["output_file_name"] = profile.get("output_filename") or "final_output"
+    st.session_state[APPLIED_PROFILE_KEY] = profile["fingerprint"]
+    logger.info("Restored mapping profile %s", profile["fingerprint"])
+
+def save_mapping_profile(final_dataframes, output_columns, output_filename):
+    """
+    Saves the current mapping of all files/sheets as a profile for this template and these input headers.
+    Returns:
+        bool: True if the profile was written.
+    """
+    if not final_dataframes or any("header_signature" not in file_data for file_data in final_dataframes):
+        return False
+    signatures = [file_data["header_signature"] for file_data in final_dataframes]
+    entries = dict(zip(entry_keys(signatures), (file_data["profile_entry"] for file_data in final_dataframes)))
+    fingerprint = template_fingerprint(output_columns, signatures)
+    saved = save_profile(fingerprint, output_columns, entries, output_filename)
+    if saved:
+        st.session_state[APPLIED_PROFILE_KEY] = fingerprint
+    return saved
+
+def validate_mapping(final_dataframes, output_columns, dedup_keys=None):
+    """
+    Validates column_mapping, include_flags and static_values for every file/sheet using headers only.
+    No row data is read, so a broken mapping is reported before any output is built.
+    Args:
+        final_dataframes (list): List of dicts with processed data for each file/sheet.
+        output_columns (list): List of output column names.
+        dedup_keys (list): Output columns used as de-duplication keys; they must be included for every file/sheet.
+    Returns:
+        list: HTML-formatted error messages (empty if the mapping is valid).
+    """
+    errors = []
+    for file_data in final_dataframes:
+        input_columns = set(file_data["input_df"].columns)
+        label = file_data["label"]
+        for key in dedup_keys or []:
+            if not file_data["include_flags"].get(key):
+                errors.append(f"❌ <b>{key}</b> is a de-duplication key but is not included for <b>{label}</b>.")
+        for col in output_columns:
+            if not file_data["include_flags"][col]:
+                continue
+            mapped_col = file_data["column_mapping"][col]
+            mapped_col = mapped_col.strip() if mapped_col else mapped_col
+            static_val = file_data["static_values"][col]
+            if mapped_col in [None, '', '--Select--']:
+                if not static_val:
+                    errors.append(f"❌ <b>{col}</b> in <b>{label}</b> is included but not mapped to any input column and has no static value.")
+            elif mapped_col == '--Blank--':
+                if static_val:
+                    errors.append(f"⚠️ <b>{col}</b> in <b>{label}</b> has both a mapping and a static value. Please provide only one.")
+            elif static_val:
+                errors.append(f"⚠️ <b>{col}</b> in <b>{label}</b> has both a mapping to '<b>{mapped_col}</b>' and a static value. Please provide only one.")
+            elif is_expression(mapped_col):
+                try:
+                    missing = compile_expression(mapped_col).missing_columns(input_columns)
+                except TransformError as e:
+                    errors.append(f"❌ <b>{col}</b> in <b>{label}</b> has an invalid expression '<b>{mapped_col}</b>': {e}.")
+                    continue
+                if missing:
+                    errors.append(f"❌ <b>{col}</b> in <b>{label}</b> uses column(s) <b>{', '.join(missing)}</b> in its expression, which do not exist in the input data.")
+            elif mapped_col not in input_columns:
+                errors.append(f"❌ <b>{col}</b> in <b>{label}</b> is mapped to '<b>{mapped_col}</b>', which does not exist in the input data.")
+    return errors
+
+def auto_format_date_columns(input_df):
+    """
+    Converts input columns whose name contains 'date' to yyyy-mm-dd when more than half the values parse as dates.
+    Args:
+        input_df (pd.DataFrame): Input DataFrame (modified in place).
+    Returns:
+        pd.DataFrame: The same DataFrame with date columns formatted.
+    """
+    for col in input_df.columns:
+        col_str = str(col)
+        if "date" in col_str.lower():
+            try:
+                parsed = pd.to_datetime(input_df[col], errors='coerce', dayfirst=False)
+                if parsed.notna().sum() > len(input_df) // 2:
+                    input_df[col] = parsed.dt.strftime('%Y-%m-%d')
+            except Exception:
+                pass
+    return input_df
+
+def build_output_frame(file_data, output_columns):
+    """
+    Builds the output DataFrame for one file/sheet from its (already validated) mapping.
+    Args:
+        file_data (dict): Processed data for one file/sheet (input_df, column_mapping, include_flags, static_values).
+        output_columns (list): List of output column names.
+    Returns:
+        pd.DataFrame: DataFrame with the included output columns.
+    Raises:
+        TransformError: If an expression fails on the data; the message is an HTML-formatted mapping error.
+    """
+    input_df = file_data["input_df"]
+    column_mapping = file_data["column_mapping"]
+    include_flags = file_data["include_flags"]
+    static_values = file_data["static_values"]
+    df_output = pd.DataFrame(index=range(len(input_df)))
+    for col in output_columns:
+        if include_flags[col]:
+            mapped_col = column_mapping[col].strip() if column_mapping[col] else column_mapping[col]
+            static_val = static_values[col]
+            # Mapping has already been validated, so only the valid combinations remain
+            if mapped_col in [None, '', '--Select--']:
+                if file_data.get("string_storage") == "categorical":
+                    df_output[col] = pd.Categorical.from_codes(np.zeros(len(input_df), dtype='int8'), categories=[static_val])
+                else:
+                    df_output[col] = static_val
+            elif mapped_col == '--Blank--':
+                df_output[col] = ""
+            elif is_expression(mapped_col):
+                try:
+                    result = compile_expression(mapped_col).evaluate(input_df)
+                except TransformError as e:
+                    raise TransformError(f"❌ <b>{col}</b> in <b>{file_data['label']}</b>: the expression '<b>{mapped_col}</b>' failed on the data: {e}") from e
+                df_output[col] = result.values if isinstance(result, pd.Series) else result
+            else:
+                df_output[col] = input_df[mapped_col].values
+    return fill_missing_columns(df_output, [col for col in output_columns if include_flags[col]])
+
+def str_isin(series, values):
+    """
+    Returns a boolean mask of rows whose string value is in values, without materialising categoricals.
+    Args:
+        series (pd.Series): Column to test.
+        values (list): String values to keep.
+    Returns:
+        pd.Series: Boolean mask.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Compare against the (few) categories and select rows by code
+        matching_codes = [code for code, cat in enumerate(series.cat.categories.astype(str)) if cat in values]
+        mask = series.cat.codes.isin(matching_codes)
+        if "nan" in values:
+            mask |= series.isna()
+        return mask
+    return series.astype(str).isin(values)
+
+def concat_output_frames(frames):
+    """
+    Concatenates per-file output frames, unifying categories first so categorical columns stay categorical.
+    Args:
+        frames (list): List of output DataFrames with the same columns.
+    Returns:
+        pd.DataFrame: Combined DataFrame.
+    """
+    if frames:
+        for col in frames[0].columns:
+            dtypes = [frame[col].dtype for frame in frames if col in frame.columns]
+            if len(dtypes) == len(frames) and all(isinstance(dtype, pd.CategoricalDtype) for dtype in dtypes):
+                categories = pd.api.types.union_categoricals([frame[col] for frame in frames]).categories
+                for frame in frames:
+                    frame[col] = frame[col].cat.set_categories(categories)
+    return pd.concat(frames, ignore_index=True)
+
+def format_output_dates(combined_df, date_format_flags, parse_masks=None):
+    """
+    Formats flagged output columns as yyyy-mm-dd.
+    Args:
+        combined_df (pd.DataFrame): Combined output DataFrame (modified in place).
+        date_format_flags (dict): Output column -> bool.
+        parse_masks (dict): If given, filled with output column -> (parsed as a date, not null or blank),
+            two boolean arrays with one entry per row.
+    Returns:
+        pd.DataFrame: The same DataFrame with flagged columns formatted.
+    """
+    for col in combined_df.columns:
+        if date_format_flags.get(col, False):
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", UserWarning)
+                try:
+                    parsed = pd.to_datetime(combined_df[col], errors='coerce', dayfirst=False)
+                    if parse_masks is not None:
+                        values = combined_df[col]
+                        parse_masks[col] = (parsed.notna().to_numpy(), (values.notna() & (values.astype(str).str.strip() != "")).to_numpy())
+                    if parsed.notna().sum() > 0:
+                        combined_df[col] = parsed.dt.strftime('%Y-%m-%d')
+                except Exception:
+                    pass
+    return combined_df
+
+def to_excel_bytes(combined_df):
+    """
+    Writes the final output to an in-memory Excel workbook.
+    Returns:
+        io.BytesIO: Buffer positioned at the start.
+    """
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl', mode='w') as writer:
+        combined_df.to_excel(writer, index=False, sheet_name='FinalMappedData')
+    output.seek(0)
+    return output
+
+def to_txt_bytes(combined_df):
+    """
+    Writes the final output as pipe-concatenated UTF-16 text (pipes inside values are replaced by spaces).
+    Returns:
+        bytes: Encoded TXT content.
+    """
+    # Object dtype so categorical columns accept the "" fill value
+    combined_df_txt = combined_df.astype(object).fillna("")
+    def escape_pipes(val): return str(val).replace("|", " ")
+    header_line = "|".join(combined_df_txt.columns)
+    txt_lines = combined_df_txt.astype(str).apply(lambda row: "|".join(escape_pipes(v) for v in row.values), axis=1)
+    txt_content = "\n".join([header_line] + txt_lines.to_list())
+    return txt_content.encode("utf-16")
+
+MAPPING_EXPORT_COLUMNS = ["FileName", "SheetName", "OutputColumn", "InputColumn", "ContentHash"]
+
+def build_mapping_export(final_dataframes, output_columns):
+    """
+    Builds the exportable mapping (FileName, SheetName, OutputColumn, InputColumn) for all files/sheets.
+    ContentHash identifies the exact input content, so append mode can tell which inputs an output already contains.
+    Returns:
+        pd.DataFrame: Mapping DataFrame.
+    """
+    mapping_rows = []
+    for file_data in final_dataframes:
+        file_name = file_data["file"].name
+        file_hash = content_hash(file_data["file"])
+        # Use the actual sheet value from file_data, which is set in app.py when user selects sheets
+        sheet_name = file_data.get("sheet", None)
+        if sheet_name is None:
+            sheet_name = ""
+        else:
+            sheet_name = str(sheet_name)
+        for col in output_columns:
+            mapped_col = file_data["column_mapping"].get(col, "")
+            if mapped_col is None:
+                mapped_col = ""
+            mapping_rows.append({"FileName": file_name, "SheetName": sheet_name, "OutputColumn": col, "InputColumn": mapped_col, "ContentHash": file_hash})
+    return pd.DataFrame(mapping_rows, columns=MAPPING_EXPORT_COLUMNS)
+
+def read_previous_output(file):
+    """
+    Reads a previously generated output (Excel or pipe-concatenated UTF-16 TXT) as all-string columns.
+    Args:
+        file: Uploaded or staged output file.
+    Returns:
+        pd.DataFrame: Previous output rows.
+    """
+    source = getattr(file, "path", file)
+    if file.name.lower().endswith(".txt"):
+        # Inverse of to_txt_bytes: no quoting, blanks were written as ""
+        return pd.read_csv(source, sep="|", encoding="utf-16", dtype=str, keep_default_na=False, quoting=csv.QUOTE_NONE)
+    # Keep values such as "NA" or "null" as text; empty cells come back as "" like in the TXT branch
+    return pd.read_excel(source, sheet_name=0, dtype=str, keep_default_na=False, na_filter=False)
+
+def select_new_inputs(final_dataframes, previous_mapping_df):
+    """
+    Splits files/sheets into those already contained in a previous output and new ones.
+    Inputs are matched by content hash and sheet; mapping exports without ContentHash fall back to file name and sheet.
+    Args:
+        final_dataframes (list): List of dicts with processed data for each file/sheet.
+        previous_mapping_df (pd.DataFrame): The column_mapping.csv exported with the previous output.
+    Returns:
+        tuple: (new file/sheet dicts, labels of skipped files/sheets)
+    """
+    sheets = previous_mapping_df["SheetName"].fillna("").astype(str).str.strip()
+    if "ContentHash" in previous_mapping_df.columns:
+        known = set(zip(previous_mapping_df["ContentHash"].fillna("").astype(str), sheets))
+        input_key = lambda file_data: (content_hash(file_data["file"]), str(file_data.get("sheet") or ""))
+    else:
+        known = set(zip(previous_mapping_df["FileName"].fillna("").astype(str).str.strip(), sheets))
+        input_key = lambda file_data: (file_data["file"].name, str(file_data.get("sheet") or ""))
+    new_dataframes, skipped = [], []
+    for file_data in final_dataframes:
+        if input_key(file_data) in known:
+            skipped.append(file_data["label"])
+        else:
+            new_dataframes.append(file_data)
+    return new_dataframes, skipped
+
 def process_final_output(final_dataframes, output_columns, output_filename):
     """
     Processes the final output by consolidating mapped dataframes, handling errors, and providing download options.
+    In append mode, only files/sheets not contained in a previous output are processed and appended to it.
     Args:
         final_dataframes (list): List of dicts with processed data for each file/sheet.
         output_columns (list): List of output column names.
@@ -267,121 +660,160 @@ def process_final_output(final_dataframes, output_columns, output_filename):
     Returns:
         pd.DataFrame or None: The final combined DataFrame, or None if errors exist.
     """
-    import io, warnings
-    import pandas as pd
     st.markdown("---")
+    dedup_col, keep_col = st.columns([3, 2])
+    with dedup_col:
+        dedup_keys = st.multiselect("🧹 De-duplicate output rows by key columns (optional):", output_columns, key="dedup_keys",
+                                    help="Rows with the same values in these output columns are treated as the same record.")
+    with keep_col:
+        dedup_keep = st.radio("When a key repeats:", [KEEP_FIRST, KEEP_LAST], key="dedup_keep", horizontal=True, disabled=not dedup_keys,
+                              format_func=lambda keep: "Keep first" if keep == KEEP_FIRST else "Keep last (later files replace earlier rows)")
+    with st.expander("➕ Append to a previous output (optional)"):
+        st.caption("Upload a previously generated output and the column_mapping.csv downloaded with it. Input files/sheets already in that output (matched by content) are skipped; only new ones are processed and appended.")
+        previous_output_file = stage_upload(st.file_uploader("Previous output file (Excel or TXT)", type=["xlsx", "txt"], key="append_output_uploader"))
+        previous_mapping_file = stage_upload(st.file_uploader("Its column_mapping.csv", type=["csv"], key="append_mapping_uploader"))
+    append_mode = previous_output_file is not None and previous_mapping_file is not None
     if st.button("🔄 Generate Final Output"):
-        with st.spinner("Processing files..."):
-            combined_df_list = []
-            all_mapping_errors = []
-            for file_data in final_dataframes:
-                input_df = file_data["input_df"]
-                column_mapping = file_data["column_mapping"]
-                include_flags = file_data["include_flags"]
-                static_values = file_data["static_values"]
-                df_output = pd.DataFrame(index=range(len(input_df)))
-                for col in output_columns:
-                    if include_flags[col]:
-                        mapped_col = column_mapping[col].strip() if column_mapping[col] else column_mapping[col]
-                        static_val = static_values[col]
-
-                        # 1. If mapped_col is None, '', or '--Select--' and no static value: error
-                        if mapped_col in [None, '', '--Select--'] and not static_val:
-                            all_mapping_errors.append(f"❌ <b>{col}</b> in <b>{file_data['label']}</b> is included but not mapped to any input column and has no static value.")
-                            df_output[col] = [""] * len(input_df)
-                            continue
-                        # 2. If mapped_col is None, '', or '--Select--' and static value: fill with static value
-                        if mapped_col in [None, '', '--Select--'] and static_val:
-                            df_output[col] = [static_val] * len(input_df)
-                            continue
-                        # 3. If mapped_col is '--Blank--' and no static value: fill with empty
-                        if mapped_col == '--Blank--' and not static_val:
-                            df_output[col] = [""] * len(input_df)
-                            continue
-                        # 4. If mapped_col is '--Blank--' and static value: error
-                        if mapped_col == '--Blank--' and static_val:
-                            all_mapping_errors.append(f"⚠️ <b>{col}</b> in <b>{file_data['label']}</b> has both a mapping and a static value. Please provide only one.")
-                            df_output[col] = [""] * len(input_df)
-                            continue
-                        # 5. Normal mapping: mapped_col is a real column name, no static value
-                        if static_val and mapped_col not in [None, '', '--Select--', '--Blank--']:
-                            all_mapping_errors.append(f"⚠️ <b>{col}</b> in <b>{file_data['label']}</b> has both a mapping to '<b>{mapped_col}</b>' and a static value. Please provide only one.")
-                            df_output[col] = [""] * len(input_df)
-                        elif mapped_col in input_df.columns:
-                            df_output[col] = input_df[mapped_col].values
-                        else:
-                            all_mapping_errors.append(f"❌ <b>{col}</b> in <b>{file_data['label']}</b> is mapped to '<b>{mapped_col}</b>', which does not exist in the input data.")
-                            df_output[col] = [""] * len(input_df)
-                        # The loop will continue to the next 'col' after this block.
-                df_output = fill_missing_columns(df_output, [col for col in output_columns if include_flags[col]])
-                combined_df_list.append(df_output)
-            if all_mapping_errors:
-                st.warning("⚠️ Please resolve the mapping errors below before proceeding.")
-                try: st.toast("⚠️ Mapping errors found! Please check and fix them.", icon="⚠️")
-                except Exception: pass
-                for err in all_mapping_errors:
-                    st.markdown(err, unsafe_allow_html=True)
+        previous_df = None
+        previous_mapping_df = None
+        new_dataframes = final_dataframes
+        if append_mode:
+            with stage_timer("parse", previous_mapping_file.name):
+                previous_mapping_df, _ = read_file(previous_mapping_file)
+            if previous_mapping_df is None:
                 return None
-            else:
-                combined_df = pd.concat(combined_df_list, ignore_index=True)
-                for col in combined_df.columns:
-                    if file_data["date_format_flags"].get(col, False):
-                        with warnings.catch_warnings():
-                            warnings.simplefilter("ignore", UserWarning)
-                            try:
-                                parsed = pd.to_datetime(combined_df[col], errors='coerce', dayfirst=False)
-                                if parsed.notna().sum() > 0:
-                                    combined_df[col] = parsed.dt.strftime('%Y-%m-%d')
-                            except Exception:
-                                pass
+            if not {"FileName", "SheetName", "OutputColumn", "InputColumn"}.issubset(previous_mapping_df.columns):
+                st.error("❌ The previous mapping file must be a column_mapping.csv downloaded from this tool.")
+                return None
+            new_dataframes, skipped = select_new_inputs(final_dataframes, previous_mapping_df)
+            st.caption(f"➕ Append mode: {len(skipped)} file(s)/sheet(s) already in the previous output skipped, {len(new_dataframes)} new.")
+            if not new_dataframes:
+                st.info("ℹ️ All input files/sheets are already contained in the previous output; nothing to append.")
+                return None
+            try:
+                with stage_timer("parse", previous_output_file.name):
+                    previous_df = read_previous_output(previous_output_file)
+            except Exception as e:
+                logger.exception("Error reading previous output %s", previous_output_file.name)
+                st.error(f"Error reading previous output {previous_output_file.name}: {str(e)}")
+                return None
+            unknown_cols = [col for col in previous_df.columns if col not in output_columns]
+            if unknown_cols:
+                st.error(f"❌ The previous output has column(s) not in the output template: {', '.join(map(str, unknown_cols))}.")
+                return None
+        # Validate the mapping against headers only, before any row data is touched
+        all_mapping_errors = validate_mapping(new_dataframes, output_columns, dedup_keys)
+        if previous_df is not None:
+            for key in dedup_keys:
+                if key not in previous_df.columns:
+                    all_mapping_errors.append(f"❌ <b>{key}</b> is a de-duplication key but is not a column of the previous output <b>{previous_output_file.name}</b>.")
+        if all_mapping_errors:
+            logger.info("Mapping validation failed with %d error(s)", len(all_mapping_errors))
+            st.warning("⚠️ Please resolve the mapping errors below before proceeding.")
+            try: st.toast("⚠️ Mapping errors found! Please check and fix them.", icon="⚠️")
+            except Exception: pass
+            for err in all_mapping_errors:
+                st.markdown(err, unsafe_allow_html=True)
+            return None
+        # Queue behind other sessions' jobs so concurrent large consolidations cannot exhaust memory
+        estimate_bytes = estimate_job_bytes(new_dataframes, output_columns)
+        if previous_df is not None:
+            estimate_bytes += int(previous_df.memory_usage(deep=True).sum())
+        st.caption(f"Estimated memory for this job: {estimate_bytes / 1e6:,.0f} MB")
+        with governed_job(estimate_bytes):
+            with st.spinner("Processing files..."):
+                combined_df_list = []
+                frame_sources = []
+                deduplicator = RowDeduplicator(dedup_keys, dedup_keep) if dedup_keys else None
+                # Dates are formatted per frame before de-duplication, so date keys written in different
+                # formats (and the yyyy-mm-dd dates of a previous output) compare equal
+                date_format_flags = new_dataframes[-1]["date_format_flags"]
+                frame_parse_masks = []
+                if previous_df is not None:
+                    # Previous rows come first, so keep-last lets new files replace them
+                    frame_sources.append(previous_output_file.name)
+                    with stage_timer("date parse", previous_output_file.name):
+                        frame_parse_masks.append({})
+                        previous_df = format_output_dates(previous_df, date_format_flags, frame_parse_masks[-1])
+                    if deduplicator is None:
+                        combined_df_list.append(previous_df)
+                    else:
+                        with stage_timer("dedup", previous_output_file.name):
+                            deduplicator.add(previous_df)
+                for file_data in new_dataframes:
+                    try:
+                        with stage_timer("mapping", file_data["label"]):
+                            df_output = build_output_frame(file_data, output_columns)
+                    except TransformError as e:
+                        logger.info("Expression failed during output generation: %s", e)
+                        st.warning("⚠️ Please resolve the mapping errors below before proceeding.")
+                        st.markdown(str(e), unsafe_allow_html=True)
+                        return None
+                    frame_sources.append(file_data["label"])
+                    with stage_timer("date parse", file_data["label"]):
+                        frame_parse_masks.append({})
+                        df_output = format_output_dates(df_output, date_format_flags, frame_parse_masks[-1])
+                    if deduplicator is None:
+                        combined_df_list.append(df_output)
+                    else:
+                        # De-duplicate as each frame is produced so duplicates never reach the combined output
+                        with stage_timer("dedup", file_data["label"]):
+                            deduplicator.add(df_output)
+                if deduplicator is not None:
+                    combined_df_list = deduplicator.frames
+                    dedup_stats = deduplicator.summary()
+                    logger.info("De-duplication on %s: %d distinct keys, %d rows dropped, %d rows replaced",
+                                dedup_keys, dedup_stats["distinct_keys"], dedup_stats["dropped"], dedup_stats["replaced"])
+                    st.caption(f"🧹 De-duplicated on {', '.join(dedup_keys)}: {dedup_stats['distinct_keys']:,} distinct keys, "
+                               f"{dedup_stats['dropped']:,} duplicate rows dropped, {dedup_stats['replaced']:,} rows replaced by later files.")
+                with stage_timer("concat"):
+                    combined_df = concat_output_frames(combined_df_list)
                 ordered_cols = [col for col in output_columns if col in combined_df.columns]
                 combined_df = combined_df[ordered_cols]
-                output = io.BytesIO()
+                with stage_timer("profile"):
+                    # One pass over the final rows; each source's rows are a contiguous slice of the output
+                    output_profiler = OutputProfiler()
+                    start = 0
+                    for source, frame in zip(frame_sources, combined_df_list):
+                        output_profiler.add(combined_df.iloc[start:start + len(frame)], source)
+                        start += len(frame)
+                    # Date-parse rates count only the rows that survived de-duplication, like the rest of the profile
+                    date_parse_stats = {}
+                    kept_rows = deduplicator.kept_rows if deduplicator is not None else [None] * len(frame_parse_masks)
+                    for masks, rows in zip(frame_parse_masks, kept_rows):
+                        for col, (parsed, non_blank) in masks.items():
+                            if rows is not None:
+                                parsed, non_blank = parsed[rows], non_blank[rows]
+                            parsed_count, non_blank_count = date_parse_stats.get(col, (0, 0))
+                            date_parse_stats[col] = (parsed_count + int(parsed.sum()), non_blank_count + int(non_blank.sum()))
+                    for col, (parsed, non_blank) in date_parse_stats.items():
+                        output_profiler.record_date_parse(col, parsed, non_blank)
                 try:
-                    with pd.ExcelWriter(output, engine='openpyxl', mode='w') as writer:
-                        combined_df.to_excel(writer, index=False, sheet_name='FinalMappedData')
-                    output.seek(0)
+                    with stage_timer("excel write"):
+                        output = to_excel_bytes(combined_df)
                     st.download_button(label="📥 Download Final Output File", data=output, file_name=f"{output_filename}.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
                     st.markdown('<div class="success-message">✅ Final consolidated file generated!</div>', unsafe_allow_html=True)
                 except Exception as e:
                     st.error(f"Error generating Excel file: {str(e)}")
                     st.stop()
-                combined_df_txt = combined_df.fillna("")
-                def escape_pipes(val): return str(val).replace("|", " ")
-                header_line = "|".join(combined_df_txt.columns)
-                txt_lines = combined_df_txt.astype(str).apply(lambda row: "|".join(escape_pipes(v) for v in row.values), axis=1)
-                txt_content = "\n".join([header_line] + txt_lines.to_list())
-                txt_content = txt_content.encode("utf-16")
+                with stage_timer("txt write"):
+                    txt_content = to_txt_bytes(combined_df)
                 st.download_button(label="📝 Download as TXT (pipe-concat)", data=txt_content, file_name=f"{output_filename}.txt", mime="text/plain")
-                mapping_rows = []
-                for file_data in final_dataframes:
-                    file_name = file_data["file"].name
-                    # Use the actual sheet value from file_data, which is set in app.py when user selects sheets
-                    sheet_name = file_data.get("sheet", None)
-                    if sheet_name is None:
-                        sheet_name = ""
-                    else:
-                        sheet_name = str(sheet_name)
-                    for col in output_columns:
-                        mapped_col = file_data["column_mapping"].get(col, "")
-                        if mapped_col is None:
-                            mapped_col = ""
-                        mapping_rows.append({"FileName": file_name, "SheetName": sheet_name, "OutputColumn": col, "InputColumn": mapped_col})
-                mapping_export_df = pd.DataFrame(mapping_rows, columns=["FileName", "SheetName", "OutputColumn", "InputColumn"])
-                mapping_csv = mapping_export_df.to_csv(index=False).encode("utf-8")
+                mapping_export = build_mapping_export(new_dataframes, output_columns)
+                if previous_mapping_df is not None:
+                    # Carry the previous inputs forward so the next append skips them too
+                    mapping_export = pd.concat([previous_mapping_df.reindex(columns=MAPPING_EXPORT_COLUMNS), mapping_export], ignore_index=True)
+                mapping_csv = mapping_export.to_csv(index=False).encode("utf-8")
                 col1, col2 = st.columns([3, 1])
                 with col2:
                     st.download_button(label="⬇️ Download Mapping File (CSV)", data=mapping_csv, file_name="column_mapping.csv", mime="text/csv")
+                if save_mapping_profile(final_dataframes, output_columns, output_filename):
+                    st.caption("💾 Mapping saved as a profile; it will be offered next time this template and these input headers are uploaded.")
+                logger.info("Generated output with %d rows and %d columns from %d files/sheets%s", combined_df.shape[0], combined_df.shape[1], len(new_dataframes),
+                            f" appended to {len(previous_df)} previous rows" if previous_df is not None else "")
                 st.markdown("#### Preview of Final Output")
                 st.dataframe(combined_df.head(10))
-                st.markdown(f"<div class='success-message'>Processed <b>{len(final_dataframes)}</b> files/sheets, final output has <b>{combined_df.shape[0]}</b> rows and <b>{combined_df.shape[1]}</b> columns.</div>", unsafe_allow_html=True)
+                show_output_profile(output_profiler)
+                appended = f" (appended to <b>{len(previous_df)}</b> previous rows)" if previous_df is not None else ""
+                st.markdown(f"<div class='success-message'>Processed <b>{len(new_dataframes)}</b> files/sheets{appended}, final output has <b>{combined_df.shape[0]}</b> rows and <b>{combined_df.shape[1]}</b> columns.</div>", unsafe_allow_html=True)
                 return combined_df
-
-    # Add custom CSS to align the multiselect with other widgets
-    st.markdown("""
-        <style>
-        /* Reduce the top margin and padding for the multiselect filter */
-        div[data-baseweb='select'] > div { min-height: 38px !important; }
-        div[data-baseweb='select'] { margin-top: -6px !important; }
-        </style>
-    """, unsafe_allow_html=True)
\ No newline at end of file
@@ -0,0 +1,107 @@
+"""
+mapping_profiles.py
+
+Server-side store of saved mapping profiles. A profile is keyed by a fingerprint of the output template
+columns and the header signatures of the input files/sheets, so a returning upload can be matched to the
+mapping (including static values, filters, date flags and header rows) used last time.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from app_logging import get_logger
+
+logger = get_logger("mapping_profiles")
+
+PROFILE_DIR = os.environ.get("COLUMN_MAPPING_PROFILE_DIR", os.path.join(os.path.expanduser("~"), ".column_mapping_profiles"))
+PROFILE_VERSION = 2
+
+def _hash(value):
+    return hashlib.sha256(json.dumps(value, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def header_signature(columns):
+    """
+    Returns a short signature of an input file/sheet's raw headers (order-sensitive, whitespace stripped).
+    Args:
+        columns (list): Column names as read from the file.
+    Returns:
+        str: Signature.
+    """
+    return _hash([str(col).strip() for col in columns])[:16]
+
+def template_fingerprint(output_columns, signatures):
+    """
+    Fingerprints an output template together with the set of input header signatures.
+    Upload order and repeated files with the same headers do not change the fingerprint.
+    Args:
+        output_columns (list): Output template column names.
+        signatures (list): Header signatures of the input files/sheets.
+    Returns:
+        str: Fingerprint.
+    """
+    return _hash({"output_columns": [str(col) for col in output_columns], "inputs": sorted(set(signatures))})[:24]
+
+def entry_keys(signatures):
+    """
+    Returns the profile entry key of each file/sheet: its header signature plus its position among the
+    files/sheets with the same headers, so several files/sheets sharing a header keep their own settings.
+    Args:
+        signatures (list): Header signatures of the input files/sheets, in upload order.
+    Returns:
+        list: Entry keys ("<signature>#<n>").
+    """
+    seen = {}
+    keys = []
+    for signature in signatures:
+        keys.append(f"{signature}#{seen.get(signature, 0)}")
+        seen[signature] = seen.get(signature, 0) + 1
+    return keys
+
+def _profile_path(fingerprint):
+    return os.path.join(PROFILE_DIR, f"{fingerprint}.json")
+
+def load_profile(fingerprint):
+    """
+    Loads the saved profile for a fingerprint.
+    Returns:
+        dict or None: The profile, or None if there is none (or it cannot be read).
+    """
+    path = _profile_path(fingerprint)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as handle:
+            profile = json.load(handle)
+    except (OSError, ValueError):
+        logger.warning("Could not read mapping profile %s", path, exc_info=True)
+        return None
+    if profile.get("version") != PROFILE_VERSION:
+        return None
+    return profile
+
+def save_profile(fingerprint, output_columns, entries, output_filename):
+    """
+    Saves a profile atomically.
+    Args:
+        fingerprint (str): Template fingerprint.
+        output_columns (list): Output template column names.
+        entries (dict): Entry key (see entry_keys) -> saved widget state of that file/sheet.
+        output_filename (str): Output file name used.
+    Returns:
+        bool: True if the profile was written.
+    """
+    profile = {"version": PROFILE_VERSION, "fingerprint": fingerprint, "saved_at": time.time(),
+               "output_columns": list(output_columns), "output_filename": output_filename, "entries": entries}
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=PROFILE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as handle:
+            json.dump(profile, handle, ensure_ascii=False, default=str)
+        os.replace(tmp_path, _profile_path(fingerprint))
+    except OSError:
+        logger.warning("Could not save mapping profile %s", fingerprint, exc_info=True)
+        return False
+    logger.info("Saved mapping profile %s (%d input file(s)/sheet(s))", fingerprint, len(entries))
+    return True
@@ -0,0 +1,130 @@
+"""
+output_profile.py
+
+Per-output-column data profile built while the output is assembled: null/blank counts, an approximate
+distinct count (HyperLogLog sketch), min/max value length, date-parse success rate and the rows each
+source file/sheet contributes. Frames are added one at a time, so the combined output is never scanned
+a second time.
+"""
+
+import numpy as np
+import pandas as pd
+
+# 2**12 HyperLogLog registers: about 1.6% standard error on distinct counts, 4 KB per column
+HLL_PRECISION = 12
+
+def _hll_update(registers, values):
+    """
+    Adds values (object array) to HyperLogLog registers in place.
+    """
+    if len(values) == 0:
+        return
+    hashes = pd.util.hash_array(values, categorize=False)
+    index = (hashes >> np.uint64(64 - HLL_PRECISION)).astype(np.int64)
+    # The remaining 52 bits convert to float64 exactly, so frexp gives the exact bit length
+    rest = (hashes & np.uint64((1 << (64 - HLL_PRECISION)) - 1)).astype(np.float64)
+    bit_length = np.frexp(rest)[1]
+    rank = (64 - HLL_PRECISION - bit_length + 1).astype(np.uint8)
+    np.maximum.at(registers, index, rank)
+
+def _hll_estimate(registers):
+    m = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(np.ldexp(1.0, -registers.astype(np.int64)))
+    zeros = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * m and zeros:
+        # Small-range correction (linear counting)
+        estimate = m * np.log(m / zeros)
+    return int(round(estimate))
+
+class OutputProfiler:
+    """
+    Streaming profile of output columns. Call add() once per output frame (with its source label),
+    record_date_parse() for date-formatted columns, then summary() / source_summary().
+    """
+    def __init__(self):
+        self.total_rows = 0
+        self.columns = {}
+        self.source_rows = {}
+
+    def _column(self, col):
+        if col not in self.columns:
+            self.columns[col] = {"present_rows": 0, "nulls": 0, "blanks": 0, "min_length": None, "max_length": None,
+                                 "registers": np.zeros(1 << HLL_PRECISION, dtype=np.uint8), "date_parse": None, "by_source": {}}
+        return self.columns[col]
+
+    def add(self, frame, source):
+        """
+        Profiles one output frame.
+        Args:
+            frame (pd.DataFrame): Output frame (one file/sheet).
+            source (str): Label of the file/sheet the rows come from.
+        """
+        rows = len(frame)
+        self.total_rows += rows
+        self.source_rows[source] = self.source_rows.get(source, 0) + rows
+        for col in frame.columns:
+            stats = self._column(col)
+            series = frame[col]
+            stats["present_rows"] += rows
+            present = series.dropna()
+            stats["nulls"] += rows - len(present)
+            # One hash-based value count per column; length, blank and sketch updates then run on distinct values only
+            value_counts = present.value_counts(sort=False)
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                # Unused categories are reported with a zero count
+                value_counts = value_counts.iloc[value_counts.to_numpy() > 0]
+            values = value_counts.index.astype(str)
+            counts = value_counts.to_numpy()
+            if len(values):
+                lengths = np.asarray(values.str.len())
+                blank = np.asarray(values.str.strip() == "")
+                blanks = int(counts[blank].sum())
+                stats["blanks"] += blanks
+                if (~blank).any():
+                    min_length, max_length = int(lengths[~blank].min()), int(lengths[~blank].max())
+                    stats["min_length"] = min_length if stats["min_length"] is None else min(stats["min_length"], min_length)
+                    stats["max_length"] = max_length if stats["max_length"] is None else max(stats["max_length"], max_length)
+                _hll_update(stats["registers"], values.to_numpy(dtype=object)[~blank])
+                filled = len(present) - blanks
+            else:
+                filled = 0
+            stats["by_source"][source] = stats["by_source"].get(source, 0) + filled
+
+    def record_date_parse(self, col, parsed, non_blank):
+        """
+        Records the date-parse result of a date-formatted column.
+        Args:
+            col (str): Output column.
+            parsed (int): Values that parsed as dates.
+            non_blank (int): Values that were not null or blank.
+        """
+        self._column(col)["date_parse"] = (int(parsed), int(non_blank))
+
+    def summary(self):
+        """
+        Returns one dict per output column: rows, nulls, blanks, filled %, approximate distinct count,
+        min/max length and date-parse success % (None for columns not date-formatted).
+        """
+        result = []
+        for col, stats in self.columns.items():
+            # Rows from frames without this column are null in the combined output
+            nulls = stats["nulls"] + self.total_rows - stats["present_rows"]
+            filled = self.total_rows - nulls - stats["blanks"]
+            date_parse = stats["date_parse"]
+            result.append({
+                "column": col, "rows": self.total_rows, "nulls": nulls, "blanks": stats["blanks"],
+                "filled_pct": round(100 * filled / self.total_rows, 1) if self.total_rows else None,
+                "distinct_approx": min(_hll_estimate(stats["registers"]), filled) if filled else 0,
+                "min_length": stats["min_length"], "max_length": stats["max_length"],
+                "date_parse_pct": round(100 * date_parse[0] / date_parse[1], 1) if date_parse and date_parse[1] else None,
+            })
+        return result
+
+    def source_summary(self):
+        """
+        Returns one dict per source file/sheet: rows contributed, share of the output and filled values per column.
+        """
+        return [{"source": source, "rows": rows, "share_pct": round(100 * rows / self.total_rows, 1) if self.total_rows else None,
+                 **{col: stats["by_source"].get(source, 0) for col, stats in self.columns.items()}}
+                for source, rows in self.source_rows.items()]
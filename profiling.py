@@ -0,0 +1,187 @@
+"""
+profiling.py
+
+Lightweight instrumentation for the app: per-stage timers, per-file row/byte counts,
+peak memory, and an optional cProfile/pyinstrument capture of a full script run.
+Diagnostics are kept in Streamlit session state and reset at the start of every rerun.
+"""
+
+import cProfile
+import io
+import json
+import pstats
+import sys
+import time
+from contextlib import contextmanager
+
+import streamlit as st
+from app_logging import get_logger
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+try:
+    from pyinstrument import Profiler as PyinstrumentProfiler
+except ImportError:
+    PyinstrumentProfiler = None
+
+DIAGNOSTICS_KEY = "_diagnostics"
+PROFILER_KEY = "_active_profiler"
+
+logger = get_logger("profiling")
+
+# Ordered list of the stages we time; used to sort the diagnostics table
+STAGES = ["upload", "sheet probe", "sniff", "parse", "header detect", "date parse", "queue", "mapping", "dedup", "concat", "profile", "excel write", "txt write"]
+
+# True until the first script run in this process has been recorded (module imports are cached afterwards)
+_cold_start = True
+
+def reset_diagnostics(run_started=None):
+    """
+    Starts a fresh diagnostics record for the current script run.
+    Args:
+        run_started (float): time.time() at the top of the script, so import time is included. Defaults to now.
+    Returns:
+        dict: The new diagnostics record.
+    """
+    global _cold_start
+    diagnostics = {"run_started": run_started or time.time(), "run_seconds": None, "first_paint_seconds": None, "cold_start": _cold_start,
+                   "stages": [], "files": {}, "peak_memory_mb": None, "profile": None}
+    _cold_start = False
+    st.session_state[DIAGNOSTICS_KEY] = diagnostics
+    return diagnostics
+
+def get_diagnostics():
+    """
+    Returns the diagnostics record for the current run, creating it if needed.
+    Returns:
+        dict: Diagnostics record.
+    """
+    if DIAGNOSTICS_KEY not in st.session_state:
+        return reset_diagnostics()
+    return st.session_state[DIAGNOSTICS_KEY]
+
+@contextmanager
+def stage_timer(stage, label=None):
+    """
+    Times a block of code and records it under the given stage.
+    Args:
+        stage (str): Stage name (see STAGES).
+        label (str): Optional file/sheet label the stage applies to.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        get_diagnostics()["stages"].append({"stage": stage, "label": label, "seconds": seconds})
+        logger.debug("stage=%s label=%s seconds=%.4f", stage, label, seconds)
+
+def record_file_stats(label, rows=None, nbytes=None, memory_saved_bytes=None, csv_format=None):
+    """
+    Records row and byte counts for an input file/sheet.
+    Args:
+        label (str): File/sheet label.
+        rows (int): Number of data rows.
+        nbytes (int): Size of the uploaded file in bytes.
+        memory_saved_bytes (int): Memory saved by compact string storage.
+        csv_format (dict): Sniffed CSV format (encoding, delimiter, quote char, BOM).
+    """
+    stats = get_diagnostics()["files"].setdefault(label, {})
+    if rows is not None:
+        stats["rows"] = int(rows)
+    if nbytes is not None:
+        stats["bytes"] = int(nbytes)
+    if memory_saved_bytes is not None:
+        stats["memory_saved_bytes"] = int(memory_saved_bytes)
+    if csv_format is not None:
+        stats["csv_format"] = dict(csv_format)
+
+def peak_memory_mb():
+    """
+    Returns the peak resident set size of the process in MB, or None if unavailable.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def start_profiler():
+    """
+    Starts a profiler for the rest of the script run. Uses pyinstrument if installed, otherwise cProfile.
+    """
+    if PyinstrumentProfiler is not None:
+        profiler = PyinstrumentProfiler()
+    else:
+        profiler = cProfile.Profile()
+    if isinstance(profiler, cProfile.Profile):
+        profiler.enable()
+    else:
+        profiler.start()
+    st.session_state[PROFILER_KEY] = profiler
+
+def stop_profiler(limit=40):
+    """
+    Stops the running profiler (if any) and stores a text report in the diagnostics.
+    Args:
+        limit (int): Number of cProfile entries to keep in the report.
+    """
+    profiler = st.session_state.pop(PROFILER_KEY, None)
+    if profiler is None:
+        return
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(limit)
+        get_diagnostics()["profile"] = {"engine": "cProfile", "report": stream.getvalue()}
+    else:
+        profiler.stop()
+        get_diagnostics()["profile"] = {"engine": "pyinstrument", "report": profiler.output_text(unicode=True)}
+
+def mark_first_paint():
+    """
+    Records the time from script start until the upload page has been rendered.
+    """
+    diagnostics = get_diagnostics()
+    if diagnostics["first_paint_seconds"] is None:
+        diagnostics["first_paint_seconds"] = time.time() - diagnostics["run_started"]
+
+def finish_diagnostics():
+    """
+    Closes the diagnostics record for the current run (total time and peak memory).
+    Returns:
+        dict: Diagnostics record.
+    """
+    stop_profiler()
+    diagnostics = get_diagnostics()
+    diagnostics["run_seconds"] = time.time() - diagnostics["run_started"]
+    diagnostics["peak_memory_mb"] = peak_memory_mb()
+    # Cold starts are rare and worth logging; warm reruns only at DEBUG
+    (logger.info if diagnostics["cold_start"] else logger.debug)("Script run %.3f s (%s), first paint %s", diagnostics["run_seconds"], "cold start" if diagnostics["cold_start"] else "warm rerun",
+                f"{diagnostics['first_paint_seconds']:.3f} s" if diagnostics["first_paint_seconds"] is not None else "n/a")
+    return diagnostics
+
+def stage_summary(diagnostics):
+    """
+    Aggregates recorded timings per stage, in pipeline order.
+    Args:
+        diagnostics (dict): Diagnostics record.
+    Returns:
+        list: List of dicts with stage, calls and total seconds.
+    """
+    totals = {}
+    for entry in diagnostics["stages"]:
+        total = totals.setdefault(entry["stage"], {"stage": entry["stage"], "calls": 0, "seconds": 0.0})
+        total["calls"] += 1
+        total["seconds"] += entry["seconds"]
+    order = {stage: i for i, stage in enumerate(STAGES)}
+    return sorted(totals.values(), key=lambda t: order.get(t["stage"], len(STAGES)))
+
+def diagnostics_json(diagnostics):
+    """
+    Serializes a diagnostics record to JSON bytes for download.
+    """
+    return json.dumps(dict(diagnostics, summary=stage_summary(diagnostics)), indent=2, default=str).encode("utf-8")
@@ -0,0 +1,148 @@
+"""
+resource_governor.py
+
+Process-wide resource governor for shared deployments. All Streamlit sessions run in one process, so
+output generation jobs are queued (first come, first served) behind a concurrency limit and a memory
+budget, using an up-front estimate of each job's memory. Users see their queue position while waiting.
+
+Environment variables:
+    COLUMN_MAPPING_MAX_CONCURRENT_JOBS: Jobs allowed to run at once (default 2).
+    COLUMN_MAPPING_MEMORY_BUDGET_MB: Total estimated memory allowed for running jobs
+        (default: half of the machine's physical memory, or 4096 MB if unknown).
+"""
+
+import os
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+import streamlit as st
+from app_logging import get_logger
+from profiling import stage_timer
+
+logger = get_logger("resource_governor")
+
+# Rough in-memory cost of one string cell, and how many copies of the output exist at peak
+# (per-file output frames, the combined frame, and the Excel/TXT buffers)
+BYTES_PER_CELL = 64
+OUTPUT_COPIES = 3
+
+def _default_memory_budget_mb():
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / (1024 * 1024) / 2
+    except (AttributeError, ValueError, OSError):
+        return 4096
+
+def estimate_job_bytes(final_dataframes, output_columns):
+    """
+    Estimates the peak memory of an output generation job from row counts, included columns and file sizes.
+    Args:
+        final_dataframes (list): List of dicts with processed data for each file/sheet.
+        output_columns (list): List of output column names.
+    Returns:
+        int: Estimated bytes.
+    """
+    total = 0
+    for file_data in final_dataframes:
+        included = sum(1 for col in output_columns if file_data["include_flags"].get(col))
+        total += len(file_data["input_df"]) * included * BYTES_PER_CELL * OUTPUT_COPIES
+        total += getattr(file_data["file"], "size", 0) or 0
+    return int(total)
+
+class ResourceGovernor:
+    """
+    FIFO admission control for jobs, limited by concurrency and total estimated memory.
+    A job is always admitted when nothing else is running, so an oversized job runs alone instead of never.
+    """
+    def __init__(self, max_concurrent_jobs, memory_budget_bytes):
+        self.max_concurrent_jobs = max(1, int(max_concurrent_jobs))
+        self.memory_budget_bytes = int(memory_budget_bytes)
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._running = {}
+
+    def _can_start(self, ticket, estimate_bytes):
+        if self._waiting[0] is not ticket:
+            return False
+        if not self._running:
+            return True
+        return (len(self._running) < self.max_concurrent_jobs
+                and sum(self._running.values()) + estimate_bytes <= self.memory_budget_bytes)
+
+    def status(self):
+        """
+        Returns a snapshot of the governor state: running jobs, queued jobs and reserved memory.
+        """
+        with self._cond:
+            return {"running": len(self._running), "queued": len(self._waiting), "reserved_bytes": sum(self._running.values())}
+
+    @contextmanager
+    def job(self, estimate_bytes, on_wait=None, poll_seconds=1.0):
+        """
+        Waits until the job may start, then holds its reservation for the duration of the block.
+        Args:
+            estimate_bytes (int): Estimated memory of the job.
+            on_wait (callable): Called with (queue position, running jobs) while waiting; called outside the lock.
+            poll_seconds (float): How often on_wait is refreshed.
+        """
+        ticket = object()
+        with self._cond:
+            self._waiting.append(ticket)
+        try:
+            while True:
+                with self._cond:
+                    if self._can_start(ticket, estimate_bytes):
+                        self._waiting.remove(ticket)
+                        self._running[ticket] = estimate_bytes
+                        break
+                    position = self._waiting.index(ticket) + 1
+                    running = len(self._running)
+                if on_wait:
+                    on_wait(position, running)
+                with self._cond:
+                    self._cond.wait(poll_seconds)
+        except BaseException:
+            # The session may be stopped or rerun while queued
+            with self._cond:
+                if ticket in self._waiting:
+                    self._waiting.remove(ticket)
+                self._cond.notify_all()
+            raise
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._running.pop(ticket, None)
+                self._cond.notify_all()
+
+@st.cache_resource
+def get_governor():
+    """
+    Returns the process-wide governor shared by all sessions.
+    """
+    max_jobs = int(os.environ.get("COLUMN_MAPPING_MAX_CONCURRENT_JOBS", "2"))
+    budget_mb = float(os.environ.get("COLUMN_MAPPING_MEMORY_BUDGET_MB", _default_memory_budget_mb()))
+    logger.info("Resource governor: %d concurrent job(s), %.0f MB memory budget", max_jobs, budget_mb)
+    return ResourceGovernor(max_jobs, budget_mb * 1024 * 1024)
+
+@contextmanager
+def governed_job(estimate_bytes):
+    """
+    Runs a block under the shared governor, showing the user their queue position while they wait.
+    Args:
+        estimate_bytes (int): Estimated memory of the job.
+    """
+    governor = get_governor()
+    if estimate_bytes > governor.memory_budget_bytes:
+        st.warning(f"⚠️ This job is estimated at {estimate_bytes / 1e6:,.0f} MB, above the server budget of {governor.memory_budget_bytes / 1e6:,.0f} MB. It will run once no other job is running.")
+    placeholder = st.empty()
+    wait_started = time.time()
+
+    def on_wait(position, running):
+        placeholder.info(f"⏳ Waiting for server capacity: you are number {position} in the queue ({running} job(s) running, waited {time.time() - wait_started:.0f} s).")
+
+    with ExitStack() as stack:
+        with stage_timer("queue"):
+            stack.enter_context(governor.job(estimate_bytes, on_wait=on_wait))
+        placeholder.empty()
+        logger.info("Job started (estimated %d bytes, waited %.1f s)", estimate_bytes, time.time() - wait_started)
+        yield
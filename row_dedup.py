@@ -0,0 +1,104 @@
+"""
+row_dedup.py
+
+Hash-based de-duplication / upsert of output rows, keyed by user-selected output columns. Each file's
+output frame is de-duplicated as it is produced: key values are hashed to 64-bit integers and checked
+against an array of the key hashes seen so far (8 bytes per distinct key), so overlapping extracts are
+collapsed without building a second copy of the combined output.
+"""
+
+import numpy as np
+import pandas as pd
+
+KEEP_FIRST = "first"
+KEEP_LAST = "last"
+
+def hash_keys(frame, key_columns):
+    """
+    Hashes the key columns of each row to a uint64. Values are compared as text, so the same key stored
+    as a plain string in one file and as a categorical in another hashes the same.
+    Args:
+        frame (pd.DataFrame): Output frame containing all key columns.
+        key_columns (list): Key column names.
+    Returns:
+        np.ndarray: uint64 hash per row.
+    """
+    keys = pd.DataFrame({col: frame[col].astype(object).where(frame[col].notna(), "").astype(str) for col in key_columns})
+    # categorize=False: factorizing first only pays off for low-cardinality keys
+    return pd.util.hash_pandas_object(keys, index=False, categorize=False).to_numpy()
+
+class RowDeduplicator:
+    """
+    Incremental de-duplication across a sequence of output frames.
+
+    keep="first" drops rows whose key was already seen (in an earlier file or earlier in the same file).
+    keep="last" is an upsert: a row replaces any earlier row with the same key, including rows from
+    earlier files, which are removed from the frames already added.
+    """
+    def __init__(self, key_columns, keep=KEEP_FIRST):
+        if keep not in (KEEP_FIRST, KEEP_LAST):
+            raise ValueError(f"keep must be '{KEEP_FIRST}' or '{KEEP_LAST}', got {keep!r}")
+        self.key_columns = list(key_columns)
+        self.keep = keep
+        self.dropped = 0
+        self.replaced = 0
+        self._seen = np.empty(0, dtype=np.uint64)
+        self._frames = []
+        self._frame_hashes = []
+        self._frame_rows = []
+
+    def add(self, frame):
+        """
+        Adds one file's output frame, de-duplicating it against everything added so far.
+        Args:
+            frame (pd.DataFrame): Output frame containing all key columns.
+        Returns:
+            int: Rows of this frame that were kept.
+        """
+        hashes = hash_keys(frame, self.key_columns)
+        # Duplicates inside the frame itself
+        keep_mask = ~pd.Series(hashes).duplicated(keep=self.keep).to_numpy()
+        self.dropped += int((~keep_mask).sum())
+        # Hash-table membership (pandas isin) rather than np.isin, which sorts both arrays
+        seen_before = pd.Series(hashes).isin(self._seen).to_numpy()
+        if self.keep == KEEP_FIRST:
+            self.dropped += int((keep_mask & seen_before).sum())
+            keep_mask &= ~seen_before
+        else:
+            overlap = hashes[keep_mask & seen_before]
+            if len(overlap):
+                for i, (previous, previous_hashes) in enumerate(zip(self._frames, self._frame_hashes)):
+                    stale = pd.Series(previous_hashes).isin(overlap).to_numpy()
+                    if stale.any():
+                        self.replaced += int(stale.sum())
+                        self._frames[i] = previous[~stale]
+                        self._frame_hashes[i] = previous_hashes[~stale]
+                        self._frame_rows[i] = self._frame_rows[i][~stale]
+        kept_hashes = hashes[keep_mask]
+        self._frames.append(frame[keep_mask].reset_index(drop=True) if not keep_mask.all() else frame)
+        self._frame_rows.append(np.flatnonzero(keep_mask))
+        if self.keep == KEEP_LAST:
+            self._frame_hashes.append(kept_hashes)
+        self._seen = np.concatenate([self._seen, hashes[keep_mask & ~seen_before]])
+        return int(keep_mask.sum())
+
+    @property
+    def frames(self):
+        """
+        The de-duplicated frames, in the order they were added.
+        """
+        return self._frames
+
+    @property
+    def kept_rows(self):
+        """
+        Positions of the kept rows within each frame as it was added, in the order the frames were added.
+        """
+        return self._frame_rows
+
+    def summary(self):
+        """
+        Returns counts for reporting: distinct keys, dropped duplicates and replaced rows.
+        """
+        return {"key_columns": self.key_columns, "keep": self.keep, "distinct_keys": int(len(self._seen)),
+                "dropped": self.dropped, "replaced": self.replaced}
@@ -0,0 +1,76 @@
+"""
+test_file_utils.py
+
+Tests for CSV sniffing and for the pyarrow reader matching the C engine.
+"""
+
+import csv
+import pytest
+from file_utils import CSV_SAMPLE_BYTES, HAS_PYARROW, CsvFormatError, detect_csv_format, read_csv, sniff_csv_sample
+
+@pytest.mark.parametrize("sample, encoding, bom", [
+    ("a,b\nx,ü\n".encode("utf-8"), "utf-8", False),
+    ("a,b\nx,ü\n".encode("utf-8-sig"), "utf-8-sig", True),
+    ("a,b\nx,5 €\n".encode("cp1252"), "cp1252", False),
+    (b"a,b\nx,\x81\n", "latin-1", False),
+    ("a,b\nx,ü\n".encode("utf-16"), "utf-16", True),
+    (b"\xfe\xff" + "a,b\nx,ü\n".encode("utf-16-be"), "utf-16", True),
+])
+def test_encoding(sample, encoding, bom):
+    csv_format = sniff_csv_sample(sample)
+    assert (csv_format["encoding"], csv_format["bom"]) == (encoding, bom)
+    assert csv_format["sep"] == ","
+
+def test_utf8_character_cut_at_sample_end():
+    sample = ("label,b\n" + "x,é\n" * CSV_SAMPLE_BYTES).encode("utf-8")[:CSV_SAMPLE_BYTES]
+    assert sample[-1:] == b"\xc3"
+    assert sniff_csv_sample(sample)["encoding"] == "utf-8"
+
+@pytest.mark.parametrize("sep", [",", ";", "\t", "|"])
+def test_delimiter(sep):
+    sample = sep.join(["id", "name", "city"]).encode() + b"\n" + b"".join(sep.join([str(i), f"n{i}", "Paris"]).encode() + b"\n" for i in range(5))
+    assert sniff_csv_sample(sample)["sep"] == sep
+
+def test_quoted_delimiters_and_newlines():
+    csv_format = sniff_csv_sample(b'id;note\n1;"a;b"\n2;"line\nbreak"\n3;c\n')
+    assert (csv_format["sep"], csv_format["quotechar"]) == (";", '"')
+
+@pytest.mark.parametrize("sample", [b"PK\x03\x04\x14\x00\x06\x00", b"a,b\n1,\x002\n"])
+def test_binary_is_rejected(sample):
+    with pytest.raises(CsvFormatError, match="binary"):
+        sniff_csv_sample(sample)
+
+def test_rows_shorter_than_header_are_accepted():
+    assert sniff_csv_sample(b"a,b,c\n1,2\n3,4\n5,6")["sep"] == ","
+
+def test_rows_wider_than_header_are_rejected():
+    with pytest.raises(CsvFormatError, match="more fields than the 2-column header"):
+        sniff_csv_sample(b"a,b\n1,2,3\n4,5\n")
+
+def test_single_column_file_is_accepted():
+    assert sniff_csv_sample(b"name\n\"Doe, John\"\n\"Roe, Jane\"\n")["sep"] == ","
+
+def test_delimited_file_collapsing_into_one_column_is_rejected(monkeypatch):
+    # When the delimiter cannot be detected, the comma default would read this as one column
+    def fail(*args, **kwargs):
+        raise csv.Error("Could not determine delimiter")
+    monkeypatch.setattr(csv.Sniffer, "sniff", fail)
+    with pytest.raises(CsvFormatError, match="single column"):
+        sniff_csv_sample(b"a;b\n1;2\n3;4\n")
+
+@pytest.mark.skipif(not HAS_PYARROW, reason="pyarrow is not installed")
+def test_pyarrow_reader_names_columns_like_the_c_engine(tmp_path):
+    path = tmp_path / "headers.csv"
+    path.write_bytes(b"a,,a,a,\n1,2,3,4,5\n")
+    columns = {backend: list(read_csv(str(path), backend=backend).columns) for backend in ("pyarrow", "c")}
+    assert columns["pyarrow"] == columns["c"] == ["a", "Unnamed: 1", "a.1", "a.2", "Unnamed: 4"]
+
+@pytest.mark.skipif(not HAS_PYARROW, reason="pyarrow is not installed")
+def test_backends_keep_values_as_written(tmp_path):
+    path = tmp_path / "values.csv"
+    path.write_bytes(b'id,zip,amount,flag,exp,missing,note\n007,00501,1.50,TRUE,1e3,NA,"a, b"\n1,02134,-0.0,false,2E-5,,"two\nlines"\n')
+    frames = {backend: read_csv(str(path), backend=backend, csv_format=detect_csv_format(str(path))) for backend in ("pyarrow", "c")}
+    assert frames["pyarrow"].equals(frames["c"])
+    assert frames["pyarrow"].iloc[0, :5].tolist() == ["007", "00501", "1.50", "TRUE", "1e3"]
+    assert frames["pyarrow"].iloc[1, :5].tolist() == ["1", "02134", "-0.0", "false", "2E-5"]
+    assert frames["pyarrow"]["missing"].isna().all()
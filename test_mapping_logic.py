@@ -0,0 +1,93 @@
+"""
+test_mapping_logic.py
+
+Tests for the header-only mapping validation and the append-mode helpers of mapping_logic.
+"""
+
+import hashlib
+import pandas as pd
+import pytest
+from mapping_logic import MAPPING_EXPORT_COLUMNS, read_previous_output, select_new_inputs, to_excel_bytes, to_txt_bytes, validate_mapping
+from upload_staging import StagedFile
+
+def staged(path, data):
+    path.write_bytes(data)
+    return StagedFile(path.name, str(path), len(data), hashlib.sha256(data).hexdigest())
+
+def file_data(file, sheet=None):
+    return {"file": file, "sheet": sheet, "label": f"{file.name} - {sheet}" if sheet else file.name}
+
+PREVIOUS = pd.DataFrame({"ID": ["007", "NA", "3"], "Status": ["null", "", "N/A"], "Note": ["a, b", "x", "None"]})
+
+def test_txt_output_round_trip(tmp_path):
+    previous = read_previous_output(staged(tmp_path / "out.txt", to_txt_bytes(PREVIOUS)))
+    assert previous.equals(PREVIOUS)
+
+def test_txt_output_replaces_pipes_and_writes_missing_as_blank(tmp_path):
+    frame = pd.DataFrame({"A": ["x|y", None], "B": pd.Series(["c", None], dtype="category")})
+    previous = read_previous_output(staged(tmp_path / "out.txt", to_txt_bytes(frame)))
+    assert previous.values.tolist() == [["x y", "c"], ["", ""]]
+
+def test_excel_output_keeps_na_like_values(tmp_path):
+    previous = read_previous_output(staged(tmp_path / "out.xlsx", to_excel_bytes(PREVIOUS).getvalue()))
+    assert previous.values.tolist() == PREVIOUS.values.tolist()
+
+@pytest.fixture
+def inputs(tmp_path):
+    return {name: staged(tmp_path / name, name.encode() + b"\n1\n") for name in ("jan.csv", "feb.csv", "book.xlsx")}
+
+def test_select_new_inputs_by_content_hash(inputs):
+    previous_mapping = pd.DataFrame([
+        {"FileName": "renamed.csv", "SheetName": "", "OutputColumn": "A", "InputColumn": "a", "ContentHash": inputs["jan.csv"].sha256},
+        {"FileName": "book.xlsx", "SheetName": "S1", "OutputColumn": "A", "InputColumn": "a", "ContentHash": inputs["book.xlsx"].sha256},
+    ], columns=MAPPING_EXPORT_COLUMNS)
+    candidates = [file_data(inputs["jan.csv"]), file_data(inputs["feb.csv"]),
+                  file_data(inputs["book.xlsx"], "S1"), file_data(inputs["book.xlsx"], "S2")]
+    new, skipped = select_new_inputs(candidates, previous_mapping)
+    assert skipped == ["jan.csv", "book.xlsx - S1"]
+    assert [item["label"] for item in new] == ["feb.csv", "book.xlsx - S2"]
+
+def test_select_new_inputs_falls_back_to_file_name(inputs):
+    # Mapping exports from before ContentHash was added
+    previous_mapping = pd.DataFrame({"FileName": [" jan.csv "], "SheetName": [None], "OutputColumn": ["A"], "InputColumn": ["a"]})
+    new, skipped = select_new_inputs([file_data(inputs["jan.csv"]), file_data(inputs["feb.csv"])], previous_mapping)
+    assert skipped == ["jan.csv"]
+    assert [item["label"] for item in new] == ["feb.csv"]
+
+OUTPUT_COLUMNS = ["Name", "Code"]
+
+def mapped_file(mapping=None, static=None, include=None):
+    """
+    File/sheet dict as built by process_mapping_tabs: Name -> [Full Name], Code -> static "X", unless overridden.
+    """
+    return {"label": "in.csv", "input_df": pd.DataFrame(columns=["Full Name", "Country"]),
+            "column_mapping": {"Name": "Full Name", "Code": "--Select--", **(mapping or {})},
+            "static_values": {"Name": "", "Code": "X", **(static or {})},
+            "include_flags": {"Name": True, "Code": True, **(include or {})}}
+
+def test_valid_mapping_has_no_errors():
+    assert validate_mapping([mapped_file()], OUTPUT_COLUMNS, dedup_keys=["Name"]) == []
+
+@pytest.mark.parametrize("overrides, dedup_keys, message", [
+    ({"mapping": {"Code": None}, "static": {"Code": ""}}, None, "is included but not mapped to any input column and has no static value"),
+    ({"mapping": {"Code": "--Select--"}, "static": {"Code": ""}}, None, "is included but not mapped to any input column and has no static value"),
+    ({"mapping": {"Code": "--Blank--"}}, None, "has both a mapping and a static value"),
+    ({"mapping": {"Code": "Country"}}, None, "has both a mapping to '<b>Country</b>' and a static value"),
+    ({"mapping": {"Name": "expr:upper([Full Name]"}}, None, "has an invalid expression"),
+    ({"mapping": {"Name": "expr:concat([Full Name], [Region], [Country])"}}, None, "uses column(s) <b>Region</b> in its expression"),
+    ({"mapping": {"Name": " Surname "}}, None, "is mapped to '<b>Surname</b>', which does not exist in the input data"),
+    ({"include": {"Code": False}}, ["Code"], "<b>Code</b> is a de-duplication key but is not included for <b>in.csv</b>"),
+])
+def test_mapping_errors(overrides, dedup_keys, message):
+    errors = validate_mapping([mapped_file(**overrides)], OUTPUT_COLUMNS, dedup_keys)
+    assert len(errors) == 1
+    assert message in errors[0]
+
+def test_excluded_columns_are_not_validated():
+    assert validate_mapping([mapped_file(mapping={"Code": "Missing"}, include={"Code": False})], OUTPUT_COLUMNS) == []
+
+def test_errors_are_reported_for_every_file():
+    other = dict(mapped_file(mapping={"Name": "Missing"}), label="other.csv")
+    errors = validate_mapping([mapped_file(mapping={"Name": "Missing"}), other], OUTPUT_COLUMNS)
+    assert len(errors) == 2
+    assert "in.csv" in errors[0] and "other.csv" in errors[1]
@@ -0,0 +1,48 @@
+"""
+test_output_profile.py
+
+Tests for the streaming output column profile and its HyperLogLog distinct estimate.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from output_profile import HLL_PRECISION, OutputProfiler, _hll_estimate, _hll_update
+
+@pytest.mark.parametrize("distinct", [0, 1, 100, 5000, 200000])
+def test_hll_estimate_is_close(distinct):
+    registers = np.zeros(1 << HLL_PRECISION, dtype=np.uint8)
+    _hll_update(registers, np.array([f"value-{i}" for i in range(distinct)], dtype=object))
+    assert _hll_estimate(registers) == pytest.approx(distinct, rel=0.05, abs=1)
+
+def test_hll_ignores_repeated_values():
+    registers = np.zeros(1 << HLL_PRECISION, dtype=np.uint8)
+    values = np.array([f"value-{i}" for i in range(1000)], dtype=object)
+    _hll_update(registers, values)
+    before = registers.copy()
+    _hll_update(registers, values)
+    assert (registers == before).all()
+
+def test_column_summary():
+    profiler = OutputProfiler()
+    profiler.add(pd.DataFrame({"a": ["x", "yy", None, " "], "d": ["2024-01-01", "bad", "", None]}), "f1.csv")
+    profiler.add(pd.DataFrame({"a": pd.Series(["x", "zzz"], dtype="category")}), "f2.csv")
+    profiler.record_date_parse("d", 1, 2)
+    summary = {row["column"]: row for row in profiler.summary()}
+    assert summary["a"] == {"column": "a", "rows": 6, "nulls": 1, "blanks": 1, "filled_pct": 66.7, "distinct_approx": 3,
+                            "min_length": 1, "max_length": 3, "date_parse_pct": None}
+    # Rows of f2.csv have no "d" column and count as nulls
+    assert (summary["d"]["nulls"], summary["d"]["blanks"], summary["d"]["date_parse_pct"]) == (3, 1, 50.0)
+
+def test_unused_categories_are_not_counted():
+    profiler = OutputProfiler()
+    profiler.add(pd.DataFrame({"a": pd.Categorical(["x"], categories=["x", "unused-longer"])}), "f.csv")
+    row = profiler.summary()[0]
+    assert (row["distinct_approx"], row["max_length"]) == (1, 1)
+
+def test_source_summary():
+    profiler = OutputProfiler()
+    profiler.add(pd.DataFrame({"a": ["x", None, "y"]}), "f1.csv")
+    profiler.add(pd.DataFrame({"a": ["z"]}), "f2.csv")
+    assert profiler.source_summary() == [{"source": "f1.csv", "rows": 3, "share_pct": 75.0, "a": 2},
+                                         {"source": "f2.csv", "rows": 1, "share_pct": 25.0, "a": 1}]
@@ -0,0 +1,139 @@
+"""
+test_resource_governor.py
+
+Tests for FIFO admission control by concurrency and memory budget, using real threads.
+"""
+
+import threading
+import time
+import pytest
+from resource_governor import ResourceGovernor
+
+POLL_SECONDS = 0.01
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError("Timed out waiting for the governor")
+        time.sleep(POLL_SECONDS)
+
+class Job(threading.Thread):
+    """
+    Holds a governor reservation from the moment it is admitted until release() is called.
+    """
+    def __init__(self, governor, name, estimate_bytes, started):
+        super().__init__(daemon=True)
+        self.governor = governor
+        self.name = name
+        self.estimate_bytes = estimate_bytes
+        self.started = started
+        self.running = threading.Event()
+        self._release = threading.Event()
+
+    def run(self):
+        with self.governor.job(self.estimate_bytes, poll_seconds=POLL_SECONDS):
+            self.started.append(self.name)
+            self.running.set()
+            self._release.wait(5)
+
+    def release(self):
+        self._release.set()
+        self.join(5)
+
+@pytest.fixture
+def submit():
+    """
+    Starts jobs one at a time, each only after the previous one is running or queued, so queue order is known.
+    """
+    jobs = []
+
+    def submit(governor, name, estimate_bytes, started):
+        before = governor.status()
+        job = Job(governor, name, estimate_bytes, started)
+        job.start()
+        wait_until(lambda: governor.status()["running"] + governor.status()["queued"] == before["running"] + before["queued"] + 1)
+        jobs.append(job)
+        return job
+
+    yield submit
+    for job in jobs:
+        job.release()
+
+def test_jobs_start_in_fifo_order(submit):
+    governor = ResourceGovernor(1, 1000)
+    started = []
+    a = submit(governor, "a", 1, started)
+    b = submit(governor, "b", 1, started)
+    c = submit(governor, "c", 1, started)
+    assert started == ["a"]
+    a.release()
+    wait_until(b.running.is_set)
+    time.sleep(5 * POLL_SECONDS)
+    assert started == ["a", "b"]
+    b.release()
+    wait_until(c.running.is_set)
+    assert started == ["a", "b", "c"]
+
+def test_concurrency_limit(submit):
+    governor = ResourceGovernor(2, 1000)
+    started = []
+    a = submit(governor, "a", 1, started)
+    submit(governor, "b", 1, started)
+    c = submit(governor, "c", 1, started)
+    assert governor.status() == {"running": 2, "queued": 1, "reserved_bytes": 2}
+    assert not c.running.is_set()
+    a.release()
+    wait_until(c.running.is_set)
+    assert governor.status()["running"] == 2
+
+def test_memory_budget_holds_back_the_queue(submit):
+    governor = ResourceGovernor(5, 100)
+    started = []
+    a = submit(governor, "a", 60, started)
+    b = submit(governor, "b", 50, started)
+    # Fits the budget, but must not overtake b
+    c = submit(governor, "c", 10, started)
+    assert started == ["a"]
+    assert governor.status() == {"running": 1, "queued": 2, "reserved_bytes": 60}
+    a.release()
+    wait_until(lambda: b.running.is_set() and c.running.is_set())
+    assert started == ["a", "b", "c"]
+    assert governor.status()["reserved_bytes"] == 60
+
+def test_oversized_job_runs_only_alone(submit):
+    governor = ResourceGovernor(3, 100)
+    started = []
+    a = submit(governor, "a", 10, started)
+    big = submit(governor, "big", 500, started)
+    c = submit(governor, "c", 10, started)
+    assert started == ["a"]
+    a.release()
+    wait_until(big.running.is_set)
+    time.sleep(5 * POLL_SECONDS)
+    assert governor.status() == {"running": 1, "queued": 1, "reserved_bytes": 500}
+    big.release()
+    wait_until(c.running.is_set)
+    assert started == ["a", "big", "c"]
+
+def test_waiter_that_raises_leaves_the_queue(submit):
+    governor = ResourceGovernor(1, 1000)
+    started = []
+    a = submit(governor, "a", 1, started)
+    positions = []
+
+    def on_wait(position, running):
+        positions.append((position, running))
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        with governor.job(1, on_wait=on_wait, poll_seconds=POLL_SECONDS):
+            pass
+    assert positions == [(1, 1)]
+    assert governor._waiting == []
+    assert governor.status() == {"running": 1, "queued": 0, "reserved_bytes": 1}
+    a.release()
+    # The queue is not blocked by the abandoned ticket
+    with governor.job(1, poll_seconds=POLL_SECONDS):
+        assert governor.status()["running"] == 1
+    assert governor.status() == {"running": 0, "queued": 0, "reserved_bytes": 0}
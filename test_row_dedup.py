@@ -0,0 +1,56 @@
+"""
+test_row_dedup.py
+
+Tests for hash-based row de-duplication across output frames.
+"""
+
+import pandas as pd
+import pytest
+from row_dedup import KEEP_FIRST, KEEP_LAST, RowDeduplicator, hash_keys
+
+def frame(ids, values):
+    return pd.DataFrame({"id": ids, "value": values})
+
+def combined(deduplicator):
+    return pd.concat(deduplicator.frames, ignore_index=True)
+
+def test_hash_keys_compare_as_text():
+    plain = pd.DataFrame({"id": ["1", "2", None]})
+    categorical = pd.DataFrame({"id": pd.Series(["1", "2", None], dtype="category")})
+    assert (hash_keys(plain, ["id"]) == hash_keys(categorical, ["id"])).all()
+
+def test_hash_keys_use_all_key_columns():
+    hashes = hash_keys(pd.DataFrame({"a": ["x", "x", "xy"], "b": ["y", "z", ""]}), ["a", "b"])
+    assert len(set(hashes.tolist())) == 3
+
+def test_keep_first_drops_later_duplicates():
+    deduplicator = RowDeduplicator(["id"], KEEP_FIRST)
+    assert deduplicator.add(frame(["1", "2", "1"], ["a", "b", "c"])) == 2
+    assert deduplicator.add(frame(["2", "3"], ["d", "e"])) == 1
+    assert combined(deduplicator).values.tolist() == [["1", "a"], ["2", "b"], ["3", "e"]]
+    assert deduplicator.summary() == {"key_columns": ["id"], "keep": KEEP_FIRST, "distinct_keys": 3, "dropped": 2, "replaced": 0}
+
+def test_keep_last_replaces_rows_of_earlier_frames():
+    deduplicator = RowDeduplicator(["id"], KEEP_LAST)
+    deduplicator.add(frame(["1", "2", "1"], ["a", "b", "c"]))
+    deduplicator.add(frame(["2", "3"], ["d", "e"]))
+    deduplicator.add(frame(["1"], ["f"]))
+    assert combined(deduplicator).values.tolist() == [["2", "d"], ["3", "e"], ["1", "f"]]
+    summary = deduplicator.summary()
+    assert (summary["distinct_keys"], summary["dropped"], summary["replaced"]) == (3, 1, 2)
+
+def test_frames_without_duplicates_are_kept_as_is():
+    deduplicator = RowDeduplicator(["id"])
+    first = frame(["1", "2"], ["a", "b"])
+    deduplicator.add(first)
+    assert deduplicator.frames[0] is first
+
+def test_invalid_keep_is_rejected():
+    with pytest.raises(ValueError, match="keep must be"):
+        RowDeduplicator(["id"], "middle")
+
+def test_kept_rows_track_positions_in_the_added_frames():
+    deduplicator = RowDeduplicator(["id"], KEEP_LAST)
+    deduplicator.add(frame(["1", "2", "1"], ["a", "b", "c"]))
+    deduplicator.add(frame(["2", "3"], ["d", "e"]))
+    assert [rows.tolist() for rows in deduplicator.kept_rows] == [[2], [0, 1]]
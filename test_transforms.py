@@ -0,0 +1,77 @@
+"""
+test_transforms.py
+
+Tests for the transform expression tokenizer, parser and evaluation.
+"""
+
+import re
+import pandas as pd
+import pytest
+from transforms import TransformError, compile_expression, is_expression
+
+def test_is_expression_needs_prefix():
+    assert is_expression("expr:upper([Name])")
+    assert is_expression("  expr:trim([Name])")
+    assert not is_expression("=upper([Name])")
+    assert not is_expression("Name")
+    assert not is_expression(None)
+
+def test_columns_and_missing_columns():
+    expression = compile_expression('expr:concat(trim([First Name]), " ", upper([ Last Name ]), [First Name])')
+    assert expression.columns == ["First Name", "Last Name"]
+    assert expression.missing_columns(["First Name", " Country "]) == ["Last Name"]
+
+def test_string_literal_escapes_and_integers():
+    df = pd.DataFrame({"a": ["x,y,z"]})
+    assert compile_expression(r'concat("say \"hi\" ", split([a], ",", 2))').evaluate(df).tolist() == ['say "hi" z']
+
+@pytest.mark.parametrize("text, message", [
+    ("", "empty"),
+    ("expr:", "empty"),
+    ("upper([a]", "Expected ')'"),
+    ("upper([a]))", "after end of expression"),
+    ("shout([a])", "Unknown function 'shout'"),
+    ("left([a])", "takes 2 argument(s), got 1"),
+    ("concat()", "at least 1 argument(s), got 0"),
+    ("upper([a]) + [b]", "Unexpected character '+'"),
+    ('split([a], "", 0)', "non-empty text separator"),
+    ("split([a], [b], 0)", "non-empty text separator"),
+])
+def test_invalid_expressions(text, message):
+    with pytest.raises(TransformError, match=re.escape(message)):
+        compile_expression(text)
+
+def test_function_names_are_case_insensitive():
+    df = pd.DataFrame({"a": [" x "]})
+    assert compile_expression("UPPER(Trim([a]))").evaluate(df).tolist() == ["X"]
+
+def test_string_functions():
+    df = pd.DataFrame({"a": ["  Jane  ", "ab-cd", None], "b": ["", "B", "fallback"]})
+    evaluate = lambda text: compile_expression(text).evaluate(df).tolist()
+    assert evaluate("trim([a])")[:2] == ["Jane", "ab-cd"]
+    assert evaluate("left(trim([a]), 2)")[:2] == ["Ja", "ab"]
+    assert evaluate("right([a], 0)")[:2] == ["", ""]
+    assert evaluate('replace([a], "-", "+")')[1] == "ab+cd"
+    parts = evaluate('split([a], "-", 1)')
+    assert pd.isna(parts[0]) and parts[1] == "cd"
+    assert evaluate("concat([a], [b])") == ["  Jane  ", "ab-cdB", "fallback"]
+    assert evaluate('coalesce([b], [a], "none")') == ["  Jane  ", "B", "fallback"]
+
+def test_missing_values_stay_missing():
+    df = pd.DataFrame({"a": ["x", None]})
+    result = compile_expression("upper([a])").evaluate(df)
+    assert result.iloc[0] == "X"
+    assert pd.isna(result.iloc[1])
+
+def test_non_string_columns_are_converted_to_text():
+    # Excel sheets are read without dtype=str, so columns may be numeric, datetime or mixed
+    df = pd.DataFrame({"n": [1.5, None], "d": pd.to_datetime(["2024-01-02", None]), "m": [1, "x"]})
+    assert compile_expression('concat([n], "|", left([d], 10), "|", [m])').evaluate(df).tolist() == ["1.5|2024-01-02|1", "||x"]
+    assert compile_expression("upper([m])").evaluate(df).tolist() == ["1", "X"]
+
+def test_expression_without_columns_returns_scalar():
+    assert compile_expression('upper("abc")').evaluate(pd.DataFrame({"a": [1]})) == "ABC"
+
+def test_evaluation_failure_is_a_transform_error():
+    with pytest.raises(TransformError, match="Could not evaluate expression"):
+        compile_expression("upper([missing])").evaluate(pd.DataFrame({"a": ["x"]}))
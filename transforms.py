@@ -0,0 +1,223 @@
+"""
+transforms.py
+
+A small transform expression language for derived output columns, compiled into vectorized pandas
+string operations so derived columns are computed in the same pass as plain mappings.
+
+In the column mapping, an expression is stored as the InputColumn value prefixed with "expr:", e.g.
+    expr:concat(trim([First Name]), " ", upper([Last Name]))
+
+Syntax:
+    [Column Name]        input column reference
+    "text"               string literal (use \\" for a quote)
+    123                  integer literal (for split/left/right)
+    func(arg, ...)       function call
+
+Functions:
+    concat(a, b, ...)        joins values; missing values count as ""
+    trim(x), upper(x), lower(x)
+    coalesce(a, b, ...)      first value that is not missing or blank
+    split(x, "sep", n)       n-th part (0-based) of x split on sep
+    left(x, n), right(x, n)  first/last n characters
+    replace(x, "old", "new") literal replacement
+"""
+
+import re
+from functools import lru_cache, reduce
+import pandas as pd
+
+# Not "=": spreadsheets would treat the exported InputColumn value as a formula
+EXPRESSION_PREFIX = "expr:"
+
+class TransformError(ValueError):
+    """
+    Raised when an expression cannot be parsed or references an unknown function.
+    """
+
+_TOKEN_RE = re.compile(r'\s*(?:(\[[^\]]*\])|("(?:[^"\\]|\\.)*")|(\d+)|([A-Za-z_]\w*)|(\()|(\))|(,))')
+
+def is_expression(value):
+    """
+    Returns True if a mapping value is a transform expression (starts with "expr:").
+    """
+    return isinstance(value, str) and value.strip().startswith(EXPRESSION_PREFIX)
+
+def _tokenize(text):
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = _TOKEN_RE.match(text, pos)
+        if not match:
+            raise TransformError(f"Unexpected character '{text[pos:].strip()[:1]}' at position {pos + 1}")
+        column, string, number, name, lparen, rparen, comma = match.groups()
+        if column is not None:
+            tokens.append(("column", column[1:-1].strip()))
+        elif string is not None:
+            tokens.append(("literal", re.sub(r'\\(.)', r'\1', string[1:-1])))
+        elif number is not None:
+            tokens.append(("literal", int(number)))
+        elif name is not None:
+            tokens.append(("name", name.lower()))
+        else:
+            tokens.append((lparen or rparen or comma, None))
+        pos = match.end()
+    return tokens
+
+def _parse(tokens):
+    """
+    Recursive-descent parser producing ("column", name) / ("literal", value) / ("call", func, args) nodes.
+    """
+    pos = 0
+
+    def expect(kind):
+        nonlocal pos
+        if pos >= len(tokens) or tokens[pos][0] != kind:
+            found = tokens[pos][0] if pos < len(tokens) else "end of expression"
+            raise TransformError(f"Expected '{kind}' but found '{found}'")
+        pos += 1
+
+    def node():
+        nonlocal pos
+        if pos >= len(tokens):
+            raise TransformError("Unexpected end of expression")
+        kind, value = tokens[pos]
+        pos += 1
+        if kind in ("column", "literal"):
+            return (kind, value)
+        if kind == "name":
+            if value not in FUNCTIONS:
+                raise TransformError(f"Unknown function '{value}'. Available: {', '.join(sorted(FUNCTIONS))}")
+            expect("(")
+            args = []
+            if pos < len(tokens) and tokens[pos][0] == ")":
+                pos += 1
+            else:
+                args.append(node())
+                while pos < len(tokens) and tokens[pos][0] == ",":
+                    pos += 1
+                    args.append(node())
+                expect(")")
+            min_args, max_args = FUNCTIONS[value][1:]
+            if len(args) < min_args or (max_args is not None and len(args) > max_args):
+                raise TransformError(f"Function '{value}' takes {min_args if min_args == max_args else f'at least {min_args}'} argument(s), got {len(args)}")
+            if value == "split" and (args[1][0] != "literal" or str(args[1][1]) == ""):
+                raise TransformError("Function 'split' needs a non-empty text separator")
+            return ("call", value, args)
+        raise TransformError(f"Unexpected '{kind}'")
+
+    tree = node()
+    if pos != len(tokens):
+        raise TransformError(f"Unexpected '{tokens[pos][0]}' after end of expression")
+    return tree
+
+# Function implementations receive already evaluated arguments: pd.Series or scalars
+
+def _as_text(value):
+    # Excel columns are read without dtype=str, so numbers, datetimes and mixed objects are converted
+    # to strings (missing values stay missing) before any .str operation
+    if isinstance(value, pd.Series):
+        return value.astype("string")
+    return value
+
+def _str_apply(value, series_fn, scalar_fn):
+    value = _as_text(value)
+    if isinstance(value, pd.Series):
+        return series_fn(value.str)
+    return None if value is None else scalar_fn(str(value))
+
+def _is_blank(value):
+    if isinstance(value, pd.Series):
+        return value.isna() | (value.astype(str).str.strip() == "")
+    return value is None or str(value).strip() == ""
+
+def _concat(*args):
+    parts = [_as_text(arg).fillna("").astype(str) if isinstance(arg, pd.Series) else ("" if arg is None else str(arg)) for arg in args]
+    return reduce(lambda a, b: a + b, parts)
+
+def _coalesce(*args):
+    result = _as_text(args[0])
+    for arg in args[1:]:
+        blank = _is_blank(result)
+        if isinstance(result, pd.Series):
+            result = result.where(~blank, _as_text(arg))
+        elif blank:
+            result = _as_text(arg)
+    return result
+
+def _split(value, sep, index):
+    return _str_apply(value, lambda s: s.split(str(sep), regex=False).str.get(int(index)),
+                      lambda v: (v.split(str(sep)) + [None] * (int(index) + 1))[int(index)])
+
+FUNCTIONS = {
+    # name: (implementation, min args, max args)
+    "concat": (_concat, 1, None),
+    "trim": (lambda x: _str_apply(x, lambda s: s.strip(), str.strip), 1, 1),
+    "upper": (lambda x: _str_apply(x, lambda s: s.upper(), str.upper), 1, 1),
+    "lower": (lambda x: _str_apply(x, lambda s: s.lower(), str.lower), 1, 1),
+    "coalesce": (_coalesce, 1, None),
+    "split": (_split, 3, 3),
+    "left": (lambda x, n: _str_apply(x, lambda s: s[:int(n)], lambda v: v[:int(n)]), 2, 2),
+    "right": (lambda x, n: _str_apply(x, lambda s: s[-int(n):] if int(n) else s[:0], lambda v: v[-int(n):] if int(n) else ""), 2, 2),
+    "replace": (lambda x, old, new: _str_apply(x, lambda s: s.replace(str(old), str(new), regex=False), lambda v: v.replace(str(old), str(new))), 3, 3),
+}
+
+class CompiledExpression:
+    """
+    A parsed transform expression. `columns` lists the input columns it references;
+    `evaluate(df)` returns a Series (or a scalar if no column is referenced).
+    """
+    def __init__(self, text, tree):
+        self.text = text
+        self.tree = tree
+        self.columns = []
+        self._collect_columns(tree)
+
+    def _collect_columns(self, node):
+        if node[0] == "column" and node[1] not in self.columns:
+            self.columns.append(node[1])
+        elif node[0] == "call":
+            for arg in node[2]:
+                self._collect_columns(arg)
+
+    def missing_columns(self, input_columns):
+        """
+        Returns the referenced columns that are not in input_columns (headers only, no data needed).
+        """
+        available = {str(col).strip() for col in input_columns}
+        return [col for col in self.columns if col not in available]
+
+    def evaluate(self, df):
+        """
+        Evaluates the expression on an input DataFrame.
+        Raises:
+            TransformError: If evaluation fails (e.g. a referenced column is missing).
+        """
+        try:
+            return self._eval(self.tree, df)
+        except TransformError:
+            raise
+        except Exception as e:
+            raise TransformError(f"Could not evaluate expression: {e}") from e
+
+    def _eval(self, node, df):
+        if node[0] == "column":
+            return df[node[1]]
+        if node[0] == "literal":
+            return node[1]
+        func = FUNCTIONS[node[1]][0]
+        return func(*[self._eval(arg, df) for arg in node[2]])
+
+@lru_cache(maxsize=256)
+def compile_expression(text):
+    """
+    Parses a transform expression (with or without the leading "expr:") into a CompiledExpression.
+    Raises:
+        TransformError: If the expression is invalid.
+    """
+    text = text.strip()
+    if text.startswith(EXPRESSION_PREFIX):
+        text = text[len(EXPRESSION_PREFIX):]
+    if not text.strip():
+        raise TransformError("Expression is empty")
+    return CompiledExpression(text, _parse(_tokenize(text)))
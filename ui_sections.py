@@ -2,9 +2,46 @@
 ui_sections.py
 
 Streamlit UI components for file upload, footer, and user guide sections.
+pandas is only imported by the sections that render output data, so the upload page paints without it.
 """
 
 import streamlit as st
+from profiling import stage_summary, diagnostics_json
+
+# All app styles, injected once per run by inject_styles()
+APP_CSS = """
+<style>
+    .stButton>button {background-color: #7A0056; color: white; border-radius: 5px; padding: 0.5rem 1rem; border: none;}
+    .stButton>button:hover {background-color: #4B0082;}
+    .mapping-header {color: #7A0056; font-weight: bold; padding: 10px; background-color: #F8F9FA; border-left: 3px solid #7A0056;}
+    .sample-column {background-color: #F8F9FA; padding: 10px; border-left: 3px solid #7A0056; margin: 5px 0;}
+    .error-message {color: #a94442; background-color: #f9eaea; border-left: 3px solid #e6a1a1; font-size: 0.95rem; padding: 6px 12px; margin: 4px 0; border-radius: 4px;}
+    .success-message {color: #008000; padding: 10px; border-left: 3px solid #008000; background-color: #E6FFE6; margin: 5px 0;}
+    .footer-ashish {color: rgba(180,180,180,0.35); background: transparent; text-align: right; font-size: 0.72rem; padding: 0 8px 2px 0; margin-top: 10px; margin-bottom: 2px; user-select: none; letter-spacing: 0.01em;}
+    /* Align the multiselect filters with the other mapping widgets */
+    div[data-baseweb='select'] > div { min-height: 38px !important; }
+    div[data-baseweb='select'] { margin-top: -6px !important; }
+</style>
+"""
+
+def inject_styles():
+    """
+    Injects the app stylesheet (APP_CSS).
+    """
+    st.markdown(APP_CSS, unsafe_allow_html=True)
+
+def _markdown_table(rows):
+    """
+    Renders a list of dicts as a Markdown table (no pandas needed for small static tables).
+    """
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    def cell(value):
+        if isinstance(value, float):
+            value = f"{value:.4f}"
+        return str("" if value is None else value).replace("|", "\\|")
+    lines = ["| " + " | ".join(columns) + " |", "|" + "---|" * len(columns)]
+    lines += ["| " + " | ".join(cell(row.get(col)) for col in columns) + " |" for row in rows]
+    return "\n".join(lines)
 
 def show_upload_section(SANOFI_COLORS):
     """
@@ -38,12 +75,8 @@ def show_footer():
     """
     Renders the custom footer in the Streamlit UI.
     """
-    st.markdown("""
-    <style>
-    .footer-ashish {color: rgba(180,180,180,0.35); background: transparent; text-align: right; font-size: 0.72rem; padding: 0 8px 2px 0; margin-top: 10px; margin-bottom: 2px; user-select: none; letter-spacing: 0.01em;}
-    </style>
-    <div class="footer-ashish">Made with ❤️ by Ashish Kumar</div>
-    """, unsafe_allow_html=True)
+    # Styled by APP_CSS
+    st.markdown('<div class="footer-ashish">Made with ❤️ by Ashish Kumar</div>', unsafe_allow_html=True)
 
 def show_guide():
     """
@@ -85,4 +118,49 @@ def show_guide():
         - 📍 **Output Column**: View the target column names
         - 🔄 **Map to Input Column**: Select which input column maps to each output column
         - 📝 **Static Value**: Optionally enter a fixed value instead of mapping
+        - 🧮 **Expression**: Choose `--Expression--` to derive a column from several inputs, e.g. `concat(trim([First Name]), " ", upper([Last Name]))`.
+          Available functions: `concat`, `trim`, `upper`, `lower`, `coalesce`, `split(x, "sep", n)`, `left(x, n)`, `right(x, n)`, `replace(x, "old", "new")`.
+          In a mapping file, write the expression in `InputColumn` prefixed with `expr:`, e.g. `expr:upper([Name])`.
         """)
+
+def show_diagnostics_panel(diagnostics):
+    """
+    Renders the collapsible diagnostics panel with stage timings, file stats, memory and profiler output.
+    Args:
+        diagnostics (dict): Diagnostics record from profiling.finish_diagnostics().
+    """
+    with st.expander("🩺 Diagnostics"):
+        run_seconds = diagnostics.get("run_seconds") or 0.0
+        peak = diagnostics.get("peak_memory_mb")
+        first_paint = diagnostics.get("first_paint_seconds")
+        run_kind = "cold start" if diagnostics.get("cold_start") else "warm rerun"
+        st.caption(f"Script run: {run_seconds:.3f} s ({run_kind}) · First paint: {f'{first_paint:.3f} s' if first_paint is not None else 'n/a'} · "
+                   f"Peak memory: {f'{peak:.1f} MB' if peak is not None else 'n/a'}")
+        # Markdown tables: rendering a dataframe would import pandas on the first (empty) page load
+        summary = stage_summary(diagnostics)
+        if summary:
+            st.markdown("**Stage timings**")
+            st.markdown(_markdown_table(summary))
+        if diagnostics["files"]:
+            st.markdown("**Input files**")
+            st.markdown(_markdown_table([{"file": label, **stats} for label, stats in diagnostics["files"].items()]))
+        if diagnostics.get("profile"):
+            st.markdown(f"**Profile ({diagnostics['profile']['engine']})**")
+            st.code(diagnostics["profile"]["report"], language="text")
+        st.download_button(label="⬇️ Download Diagnostics (JSON)", data=diagnostics_json(diagnostics), file_name="diagnostics.json", mime="application/json", key="diagnostics_download")
+
+def show_output_profile(output_profiler):
+    """
+    Renders the per-column profile of the generated output and the rows contributed by each source file/sheet.
+    Args:
+        output_profiler (OutputProfiler): Profile built while the output was assembled.
+    """
+    import pandas as pd
+    with st.expander("📊 Output Column Profile"):
+        profile_df = pd.DataFrame(output_profiler.summary())
+        st.caption("Distinct counts are HyperLogLog estimates (about ±2%). Date parse % is shown for columns formatted as dates.")
+        st.dataframe(profile_df, hide_index=True)
+        st.markdown("**Contribution by source file/sheet** (rows, share of output and filled values per column)")
+        st.dataframe(pd.DataFrame(output_profiler.source_summary()), hide_index=True)
+        st.download_button(label="⬇️ Download Column Profile (CSV)", data=profile_df.to_csv(index=False).encode("utf-8"),
+                           file_name="output_profile.csv", mime="text/csv", key="download_output_profile")
@@ -0,0 +1,125 @@
+"""
+upload_staging.py
+
+Spools each uploaded file once to a local staging directory, content-addressed by SHA-256, so that
+readers open a file path (memory-mapped CSV reads, lazy Excel access) instead of copying in-memory
+upload buffers, and caches key on the content hash instead of re-hashing the whole upload every rerun.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+import streamlit as st
+from app_logging import get_logger
+
+logger = get_logger("upload_staging")
+
+STAGING_DIR = os.environ.get("COLUMN_MAPPING_STAGING_DIR", os.path.join(tempfile.gettempdir(), "column_mapping_uploads"))
+STAGING_MAX_AGE_HOURS = float(os.environ.get("COLUMN_MAPPING_STAGING_MAX_AGE_HOURS", "24"))
+STAGED_FILES_KEY = "_staged_uploads"
+CHUNK_SIZE = 8 * 1024 * 1024
+
+_last_cleanup = 0.0
+
+class StagedFile:
+    """
+    An upload spooled to disk. Exposes `name` and `size` like an UploadedFile, plus the on-disk `path`
+    and the content `sha256`.
+    """
+    def __init__(self, name, path, size, sha256):
+        self.name = name
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+
+    def __repr__(self):
+        return f"StagedFile({self.name!r}, size={self.size}, sha256={self.sha256[:12]})"
+
+def _spool(uploaded_file):
+    """
+    Copies an upload to the staging directory in chunks while hashing it.
+    Returns:
+        StagedFile: The staged file; identical content is stored only once.
+    """
+    os.makedirs(STAGING_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    uploaded_file.seek(0)
+    fd, tmp_path = tempfile.mkstemp(dir=STAGING_DIR, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            while True:
+                chunk = uploaded_file.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                handle.write(chunk)
+                size += len(chunk)
+        sha256 = digest.hexdigest()
+        # Keep the original file name (extension checks rely on it) inside a per-hash directory
+        target_dir = os.path.join(STAGING_DIR, sha256)
+        target_path = os.path.join(target_dir, os.path.basename(uploaded_file.name))
+        os.makedirs(target_dir, exist_ok=True)
+        if os.path.exists(target_path):
+            os.remove(tmp_path)
+            os.utime(target_dir)
+        else:
+            os.replace(tmp_path, target_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        uploaded_file.seek(0)
+    logger.info("Staged %s (%d bytes, sha256 %s)", uploaded_file.name, size, sha256[:12])
+    return StagedFile(uploaded_file.name, target_path, size, sha256)
+
+def stage_upload(uploaded_file):
+    """
+    Returns the staged copy of an upload, spooling it on first use in this session.
+    Args:
+        uploaded_file: Streamlit UploadedFile (or None).
+    Returns:
+        StagedFile or None.
+    """
+    if uploaded_file is None:
+        return None
+    staged = st.session_state.setdefault(STAGED_FILES_KEY, {})
+    key = getattr(uploaded_file, "file_id", None) or (uploaded_file.name, uploaded_file.size)
+    staged_file = staged.get(key)
+    if staged_file is None or not os.path.exists(staged_file.path):
+        staged_file = _spool(uploaded_file)
+        staged[key] = staged_file
+    else:
+        # Mark as in use so cleanup_staging keeps it
+        os.utime(os.path.dirname(staged_file.path))
+    return staged_file
+
+def content_hash(file):
+    """
+    Returns a content hash usable as a cache key: the staged SHA-256, or a hash of an in-memory buffer.
+    """
+    if isinstance(file, StagedFile):
+        return file.sha256
+    return hashlib.sha256(file.getvalue()).hexdigest()
+
+def cleanup_staging(max_age_hours=STAGING_MAX_AGE_HOURS):
+    """
+    Removes staged uploads not used for max_age_hours. Runs at most once an hour per process.
+    """
+    global _last_cleanup
+    now = time.time()
+    if now - _last_cleanup < 3600 or not os.path.isdir(STAGING_DIR):
+        return
+    _last_cleanup = now
+    for entry in os.scandir(STAGING_DIR):
+        try:
+            if now - entry.stat().st_mtime > max_age_hours * 3600:
+                if entry.is_dir():
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                else:
+                    os.remove(entry.path)
+        except OSError:
+            logger.warning("Could not remove staged upload %s", entry.path, exc_info=True)